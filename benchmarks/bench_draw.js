@@ -0,0 +1,104 @@
+/**
+ * Benchmark of the rendering of a brainsprite.js viewer, in headless chrome.
+ *
+ * Load the html page of a viewer, as saved by
+ * `python benchmarks/bench_pipeline.py --page viewer.html`, sweep each plane
+ * (X, Y, Z) through all of its slices, and report statistics on the time
+ * spent in `brain.draw`, in milliseconds. The results can be saved in a json
+ * file, for regression comparison.
+ *
+ * Usage:
+ *
+ *     node benchmarks/bench_draw.js viewer.html [--repeat 5] [--output results.json]
+ */
+
+const fs = require('fs')
+const path = require('path')
+const url = require('url')
+
+// Time brain.draw for all slices of each plane. This function is evaluated
+// in the page, and must not rely on anything outside of its own scope.
+function measure (brain, repeat) {
+  const results = {}
+  const numSlice = Object.assign({}, brain.numSlice)
+  for (const type of ['X', 'Y', 'Z']) {
+    const times = []
+    for (let rr = 0; rr < repeat; rr++) {
+      for (let ss = 0; ss < brain.nbSlice[type]; ss++) {
+        brain.numSlice[type] = ss
+        const start = performance.now()
+        brain.draw(ss, type)
+        times.push(performance.now() - start)
+      }
+    }
+    brain.numSlice[type] = numSlice[type]
+    times.sort(function (a, b) { return a - b })
+    const total = times.reduce(function (a, b) { return a + b }, 0)
+    results[type] = {
+      count: times.length,
+      mean: total / times.length,
+      median: times[Math.floor(times.length / 2)],
+      p95: times[Math.min(times.length - 1, Math.floor(times.length * 0.95))],
+      max: times[times.length - 1]
+    }
+  }
+  brain.drawAll()
+  return results
+}
+
+function parseArgs (argv) {
+  const args = { page: null, repeat: 5, output: null }
+  for (let ii = 0; ii < argv.length; ii++) {
+    if (argv[ii] === '--repeat') {
+      args.repeat = Number(argv[++ii])
+    } else if (argv[ii] === '--output') {
+      args.output = argv[++ii]
+    } else {
+      args.page = argv[ii]
+    }
+  }
+  if (args.page === null) {
+    throw new Error('Usage: node benchmarks/bench_draw.js viewer.html [--repeat 5] [--output results.json]')
+  }
+  return args
+}
+
+async function main (argv) {
+  const args = parseArgs(argv)
+  const puppeteer = require('puppeteer')
+  const browser = await puppeteer.launch({
+    args: ['--no-sandbox', '--disable-setuid-sandbox']
+  })
+  try {
+    const page = await browser.newPage()
+    await page.goto(url.pathToFileURL(path.resolve(args.page)).href)
+    await page.waitForFunction('window.brain !== undefined')
+    const results = await page.evaluate(
+      '(' + measure.toString() + ')(window.brain, ' + args.repeat + ')')
+    for (const type of ['X', 'Y', 'Z']) {
+      const res = results[type]
+      console.log(type + ': ' + res.count + ' draws, mean ' + res.mean.toFixed(3) +
+        ' ms, median ' + res.median.toFixed(3) + ' ms, p95 ' + res.p95.toFixed(3) +
+        ' ms, max ' + res.max.toFixed(3) + ' ms')
+    }
+    if (args.output !== null) {
+      const metadata = {
+        page: args.page,
+        repeat: args.repeat,
+        browser: await browser.version()
+      }
+      fs.writeFileSync(args.output, JSON.stringify({ metadata, results }, null, 2))
+    }
+  } finally {
+    await browser.close()
+  }
+}
+
+module.exports = { measure }
+
+if (require.main === module) {
+  main(process.argv.slice(2)).catch(function (error) {
+    console.error(error)
+    process.exit(1)
+  })
+}
@@ -0,0 +1,67 @@
+"""Benchmark of parallel viewer generation.
+
+Time ``viewer_substitute.fit`` on a single stat map, and
+``viewer_substitute.fit_many`` on a series of stat maps, with an increasing
+number of processes. The memo of MNI152 backgrounds is cleared before each
+timed run, so that all runs load and encode the background.
+
+Usage::
+
+    python benchmarks/bench_parallel.py [n_maps]
+"""
+
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+from nilearn.datasets import load_mni152_template
+from nilearn.image import new_img_like
+
+from brainsprite import clear_cache, viewer_substitute
+
+
+def _simulate_maps(n_maps, resolution=2):
+    """Simulate stat maps on the grid of the MNI template."""
+    template = load_mni152_template(resolution=resolution)
+    rng = np.random.default_rng(0)
+    return [
+        new_img_like(template, rng.standard_normal(template.shape), template.affine)
+        for _ in range(n_maps)
+    ]
+
+
+def _time(func):
+    """Wall time of func, in s."""
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main(n_maps=8):
+    """Run the benchmark and print a table of timings."""
+    warnings.simplefilter("ignore")
+    imgs = _simulate_maps(n_maps)
+    n_cpus = os.cpu_count()
+    all_jobs = sorted({1, 2, 4, 8, n_cpus} & set(range(1, n_cpus + 1)))
+
+    print(f"{n_cpus} CPUs, {n_maps} stat maps of shape {imgs[0].shape}")
+    print(f"{'n_jobs':>6} {'fit (s)':>8} {'speedup':>8} {'fit_many (s)':>13} {'speedup':>8}")
+    reference = None
+    for n_jobs in all_jobs:
+        bsprite = viewer_substitute(threshold=3, n_jobs=n_jobs)
+        clear_cache()
+        t_fit = _time(lambda bsprite=bsprite: bsprite.fit(imgs[0]))
+        clear_cache()
+        t_many = _time(lambda bsprite=bsprite: bsprite.fit_many(imgs))
+        if reference is None:
+            reference = (t_fit, t_many)
+        print(
+            f"{n_jobs:>6} {t_fit:>8.2f} {reference[0] / t_fit:>7.1f}x "
+            f"{t_many:>13.2f} {reference[1] / t_many:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,210 @@
+"""Benchmark of the whole viewer generation pipeline.
+
+Run ``viewer_substitute.fit``, ``transform`` and ``write_html`` on synthetic stat maps at
+resolutions from 4 mm to 0.5 mm, with and without a background image, in
+neurological and radiological views. For each run, report the wall time of
+every stage of fit (see ``viewer_substitute.profile_``), the peak memory
+allocated (traced with tracemalloc), and the size of the html report.
+
+The results can be saved in a json file, and compared with the results of
+a previous run to spot regressions. The script can also save the html page
+of a viewer, to benchmark the rendering in a browser with
+``benchmarks/bench_draw.js``.
+
+Usage::
+
+    python benchmarks/bench_pipeline.py [--resolutions 4 2 1] [--output results.json]
+        [--compare baseline.json] [--page viewer.html]
+"""
+
+import argparse
+import importlib.metadata
+import itertools
+import json
+import platform
+import time
+import tracemalloc
+import warnings
+from pathlib import Path
+
+import numpy as np
+import tempita
+from nibabel import Nifti1Image
+
+from brainsprite import viewer_substitute
+
+# Grid of the MNI152 template at various resolutions (in mm)
+SHAPES = {
+    4: (46, 55, 46),
+    3: (61, 73, 61),
+    2: (91, 109, 91),
+    1: (182, 218, 182),
+    0.5: (364, 436, 364),
+}
+
+# A minimal html report, featuring one viewer. The viewer is stored in
+# window.brain, for bench_draw.js
+TEMPLATE = """<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><style>.hidden { display: none; }</style></head>
+<body>
+<div style="width: 800px">{{html}}</div>
+<script>{{library}}</script>
+<script>
+window.addEventListener("load", function () {
+  window.brain = brainsprite({{javascript}});
+});
+</script>
+</body>
+</html>
+"""
+
+
+class _ByteCounter:
+    """A text file object which only counts the bytes written to it."""
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, text):
+        self.size += len(text.encode("utf-8"))
+
+
+def _simulate_imgs(resolution):
+    """Simulate a background (a bright ellipsoid) and a stat map (two blobs
+    plus noise) on the grid of the MNI template.
+    Returns: bg_img, stat_map_img.
+    """
+    shape = SHAPES[resolution]
+    affine = np.diag([resolution, resolution, resolution, 1.0])
+    affine[:3, 3] = -resolution * np.array(shape) / 2
+    grid = np.stack(np.meshgrid(*(np.linspace(-1, 1, n) for n in shape), indexing="ij"))
+    radius = np.sqrt((grid**2).sum(axis=0))
+    background = np.clip(1 - radius, 0, None) * 100
+    blobs = np.exp(-(((grid[0] - 0.3) ** 2 + grid[1] ** 2 + grid[2] ** 2) / 0.02))
+    blobs -= np.exp(-(((grid[0] + 0.3) ** 2 + grid[1] ** 2 + grid[2] ** 2) / 0.02))
+    rng = np.random.default_rng(0)
+    stat_map = 5 * blobs + rng.standard_normal(shape).astype("float32")
+    return Nifti1Image(background, affine), Nifti1Image(stat_map, affine)
+
+
+def _run(resolution, background, radiological, page=None):
+    """Fit a viewer and write its html report, tracing memory allocations.
+    Returns: a dictionary of results.
+    """
+    bg_img, stat_map_img = _simulate_imgs(resolution)
+    template = tempita.Template(TEMPLATE)
+    bsprite = viewer_substitute(threshold=3, radiological=radiological)
+    counter = _ByteCounter()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    bsprite.fit(stat_map_img, bg_img=bg_img if background else None)
+    t_fit = time.perf_counter() - start
+    start = time.perf_counter()
+    bsprite.transform(template, "javascript", "html", "library")
+    t_transform = time.perf_counter() - start
+    start = time.perf_counter()
+    bsprite.write_html(counter, template, "javascript", "html", "library")
+    t_write = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    if page is not None:
+        bsprite.write_html(page, template, "javascript", "html", "library")
+    return {
+        "resolution": resolution,
+        "shape": list(SHAPES[resolution]),
+        "background": background,
+        "radiological": radiological,
+        "fit": t_fit,
+        "transform": t_transform,
+        "write_html": t_write,
+        "stages": bsprite.timings_,
+        "peak_memory": peak,
+        "html_bytes": counter.size,
+        "sprite_bytes": sum(len(sprite) for sprite in bsprite.sprites_),
+    }
+
+
+def _print_results(results, baseline=None):
+    """Print a table of results, with the ratio of time, memory and size to
+    the matching results of a baseline, if specified.
+    """
+    baseline = {} if baseline is None else baseline
+    print(
+        f"{'res (mm)':>8} {'bg':>3} {'radio':>5} {'fit (s)':>8} {'transform (s)':>13} "
+        f"{'write (s)':>9} "
+        f"{'peak (MB)':>9} {'html (MB)':>9}  slowest stages"
+    )
+    for result in results:
+        key = (result["resolution"], result["background"], result["radiological"])
+        stages = sorted(result["stages"].items(), key=lambda item: -item[1])[:3]
+        line = (
+            f"{result['resolution']:>8} {result['background']:>3d} {result['radiological']:>5d} "
+            f"{result['fit']:>8.2f} {result['transform']:>13.2f} {result['write_html']:>9.2f} "
+            f"{result['peak_memory'] / 1e6:>9.1f} {result['html_bytes'] / 1e6:>9.2f}  "
+            + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in stages)
+        )
+        if key in baseline:
+            ref = baseline[key]
+            line += (
+                f"  [vs baseline: fit {result['fit'] / ref['fit']:.2f}x, "
+                f"peak {result['peak_memory'] / ref['peak_memory']:.2f}x, "
+                f"html {result['html_bytes'] / ref['html_bytes']:.2f}x]"
+            )
+        print(line)
+
+
+def _version(package):
+    """Get the version of an installed package, or None."""
+    try:
+        return importlib.metadata.version(package)
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+def main(argv=None):
+    """Run the benchmark, print a table of results and optionally save them."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--resolutions", nargs="+", type=float, default=[4, 3, 2, 1, 0.5])
+    parser.add_argument("--output", help="save the results in this json file")
+    parser.add_argument("--compare", help="compare with the results saved in this json file")
+    parser.add_argument("--page", help="save the html page of the first viewer in this file")
+    args = parser.parse_args(argv)
+    warnings.simplefilter("ignore")
+
+    results = []
+    runs = itertools.product(
+        [int(res) if res.is_integer() else res for res in args.resolutions],
+        [True, False],
+        [False, True],
+    )
+    for ii, (resolution, background, radiological) in enumerate(runs):
+        page = args.page if ii == 0 else None
+        results.append(_run(resolution, background, radiological, page))
+
+    baseline = None
+    if args.compare is not None:
+        previous = json.loads(Path(args.compare).read_text())["results"]
+        baseline = {
+            (result["resolution"], result["background"], result["radiological"]): result
+            for result in previous
+        }
+    _print_results(results, baseline)
+
+    if args.output is not None:
+        metadata = {
+            "brainsprite": _version("brainsprite"),
+            "nilearn": _version("nilearn"),
+            "numpy": _version("numpy"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+        }
+        Path(args.output).write_text(
+            json.dumps({"metadata": metadata, "results": results}, indent=2)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -25,7 +25,9 @@ function initBrain (params) {
     numSlice: false,
     onclick: '',
     radiological: false,
-    showLR: true
+    showLR: true,
+    lazy: false,
+    releaseDelay: 60000
   }
   const brain = Object.assign({}, defaultParams, params)
 
@@ -79,6 +81,11 @@ function initCanvas (brain, canvas) {
   brain.canvasRead.width = 1
   brain.canvasRead.height = 1
 
+  // An in-memory canvas with the static annotations of the viewer
+  // (title, colorbar, left/right labels), drawn once per resize
+  brain.canvasAnnotations = document.createElement('canvas')
+  brain.contextAnnotations = brain.canvasAnnotations.getContext('2d')
+
   // A master sagittal canvas for the merge of background and overlay
   brain.planes = {}
   brain.planes.canvasMaster = document.createElement('canvas')
@@ -122,6 +129,9 @@ function initOverlay (brain, sprite, nbSlice) {
     Y: nbSlice.Y,
     Z: nbSlice.Z
   }
+  if (brain.overlay.values) {
+    brain.overlay.values.sprite = document.getElementById(brain.overlay.values.sprite)
+  }
 
   return brain
 }
@@ -161,11 +171,17 @@ function initColorMap (colorMap) {
  * @param {object} params.numSlice {"X", "Y", "Z"} coordinates of the initial cut. false will use the middle of the volume.
  * @param {object} params.overlay object. If false, no overlay.
  * @param {number} params.overlay.opacity the opacity of the overlay.
+ * @param {object} params.overlay.values object. If defined, the values are read from a sprite of quantized values, instead of the colors of the overlay.
+ * @param {string} params.overlay.values.sprite the id of the sprite of values. The red and green channels hold the high and low bytes of the quantized values, transparent pixels have no value.
+ * @param {number} params.overlay.values.offset the value of quantized zero.
+ * @param {number} params.overlay.values.scale the value step between two quantization levels.
  * @param {string} params.onclick command to call on click.
  * @param {object} params.colormap object. if false, no colormap.
  * @param {boolean} params.nanValue unable to read values.
  * @param {boolean} params.radiological If true plot sections as a radiological view.
  * @param {boolean} params.showLR: If true, positions and left/right annotation are added to the plot.
+ * @param {boolean} params.lazy If true, the master canvas is only composed once the viewer is visible, and released when it has been offscreen for a while.
+ * @param {number} params.releaseDelay in lazy mode, the delay (in ms) after which the master canvas of an offscreen viewer is released.
  * @return {object} a brainsprite viewer object.
  */
 function brainsprite (params) { // eslint-disable-line no-unused-vars
@@ -179,15 +195,12 @@ function brainsprite (params) { // eslint-disable-line no-unused-vars
     brain.colorMap = initColorMap(params.colorMap)
   };
 
-  const getValue = function (rgb, colorMap) {
-  // Extract the value associated with a voxel by looking up in a colormap.
-    if (!colorMap) {
-      return NaN
-    }
+  const nearestColor = function (rgb, colorMap) {
+  // Find the index of the closest color in a colormap.
     let ind = NaN
     let val = Infinity
     const nbColor = colorMap.canvas.width
-    const cv = colorMap.context.getImageData(0, 0, nbColor, 1).data
+    const cv = colorMap.table
     for (let xx = 0; xx < nbColor; xx++) {
       const dist = Math.abs(cv[xx * 4] - rgb[0]) + Math.abs(cv[xx * 4 + 1] - rgb[1]) + Math.abs(cv[xx * 4 + 2] - rgb[2])
       if (dist < val) {
@@ -195,10 +208,46 @@ function brainsprite (params) { // eslint-disable-line no-unused-vars
         val = dist
       }
     }
+    return ind
+  }
+
+  const getValue = function (rgb, colorMap) {
+  // Extract the value associated with a voxel by looking up in a colormap.
+    if (!colorMap) {
+      return NaN
+    }
+    const nbColor = colorMap.canvas.width
+    if (!colorMap.lookup) {
+      // Cache the colors of the colormap, and index them by RGB
+      colorMap.table = colorMap.context.getImageData(0, 0, nbColor, 1).data
+      colorMap.lookup = new Map()
+      for (let xx = nbColor - 1; xx >= 0; xx--) {
+        const cv = colorMap.table
+        colorMap.lookup.set((cv[xx * 4] << 16) | (cv[xx * 4 + 1] << 8) | cv[xx * 4 + 2], xx)
+      }
+    }
+    const key = (rgb[0] << 16) | (rgb[1] << 8) | rgb[2]
+    let ind = colorMap.lookup.get(key)
+    if (ind === undefined) {
+      // Not in the colormap (e.g. smoothed), remember the nearest color
+      ind = nearestColor(rgb, colorMap)
+      colorMap.lookup.set(key, ind)
+    }
 
     return (ind * (colorMap.max - colorMap.min) / (nbColor - 1)) + colorMap.min
   }
 
+  const readPixels = function (img) {
+  // Read the pixels of an image in a typed array
+    brain.canvasRead.width = img.width
+    brain.canvasRead.height = img.height
+    brain.contextRead.drawImage(img, 0, 0)
+    const pixels = brain.contextRead.getImageData(0, 0, img.width, img.height).data
+    brain.canvasRead.width = 1
+    brain.canvasRead.height = 1
+    return pixels
+  }
+
   const updateValue = function () {
     // Update voxel value
     const pos = {}
@@ -206,15 +255,27 @@ function brainsprite (params) { // eslint-disable-line no-unused-vars
       try {
         pos.XW = Math.round((brain.numSlice.X) % brain.nbCol)
         pos.XH = Math.round((brain.numSlice.X - pos.XW) / brain.nbCol)
-        brain.contextRead.clearRect(0, 0, 1, 1)
-        brain.contextRead.drawImage(
-          brain.overlay.sprite,
-          pos.XW * brain.nbSlice.Y + brain.numSlice.Y,
-          pos.XH * brain.nbSlice.Z + brain.nbSlice.Z - brain.numSlice.Z - 1,
-          1, 1, 0, 0, 1, 1)
-        const rgb = brain.contextRead.getImageData(0, 0, 1, 1).data
+        // The pixels of the sprites are read once, when the viewer is first
+        // composed (see compose). Until then, or while the sprite is being
+        // decoded, there is no value.
+        const values = brain.overlay.values
+        const sprite = values ? values.sprite : brain.overlay.sprite
+        if (!brain.overlay.pixels) {
+          if (!brain.planes.composed || !sprite.complete || !sprite.naturalWidth) {
+            brain.voxelValue = NaN
+            return
+          }
+          brain.overlay.pixels = readPixels(sprite)
+        }
+        const offset = 4 * (
+          (pos.XH * brain.nbSlice.Z + brain.nbSlice.Z - brain.numSlice.Z - 1) *
+          sprite.width + pos.XW * brain.nbSlice.Y + brain.numSlice.Y)
+        const rgb = brain.overlay.pixels.subarray(offset, offset + 4)
         if (rgb[3] === 0) {
           brain.voxelValue = NaN
+        } else if (values) {
+          // Decode the quantized value
+          brain.voxelValue = values.offset + ((rgb[0] << 8) | rgb[1]) * values.scale
         } else {
           brain.voxelValue = getValue(rgb, brain.colorMap)
         }
@@ -251,20 +312,16 @@ function brainsprite (params) { // eslint-disable-line no-unused-vars
 
     brain.resize()
 
-    // Draw the Master canvas
-    brain.planes.canvasMaster.width = brain.sprite.width
-    brain.planes.canvasMaster.height = brain.sprite.height
-    brain.planes.contextMaster.globalAlpha = 1
-    brain.planes.contextMaster.drawImage(brain.sprite,
-      0, 0, brain.sprite.width, brain.sprite.height,
-      0, 0, brain.sprite.width, brain.sprite.height)
+    // Pixels of the overlay, read when first looking up a value
     if (brain.overlay) {
-      // Draw the overlay on a canvas
-      brain.planes.contextMaster.globalAlpha = brain.overlay.opacity
-      brain.planes.contextMaster.drawImage(brain.overlay.sprite,
-        0, 0, brain.overlay.sprite.width, brain.overlay.sprite.height,
-        0, 0, brain.sprite.width, brain.sprite.height)
-    };
+      brain.overlay.pixels = null
+    }
+
+    // Draw the Master canvas, unless it is composed on demand
+    brain.planes.composed = false
+    if (!brain.lazy) {
+      brain.compose()
+    }
 
     // Draw the X canvas (sagittal)
     brain.planes.canvasX = document.createElement('canvas')
@@ -286,6 +343,14 @@ function brainsprite (params) { // eslint-disable-line no-unused-vars
     brain.planes.contextZ.rotate(-Math.PI / 2)
     brain.planes.contextZ.translate(-nY, 0)
 
+    // Pixels of the X, Y and Z slices, when sliced from the volume
+    for (const type of ['X', 'Y', 'Z']) {
+      const canvas = brain.planes['canvas' + type]
+      brain.planes['image' + type] = brain.planes['context' + type].createImageData(
+        canvas.width, canvas.height)
+      brain.planes['pixels' + type] = new Uint32Array(brain.planes['image' + type].data.buffer)
+    }
+
     // Update value
     updateValue()
 
@@ -298,6 +363,107 @@ function brainsprite (params) { // eslint-disable-line no-unused-vars
     brain.numSlice.Z = Math.round(brain.numSlice.Z)
   }
 
+  // Read the pixels of the master canvas in a typed array, one 32-bit
+  // integer per RGBA pixel. Slices are then extracted by array indexing.
+  const readVolume = function () {
+    try {
+      const pixels = brain.planes.contextMaster.getImageData(0, 0,
+        brain.sprite.width, brain.sprite.height).data
+      brain.planes.volume = new Uint32Array(pixels.buffer)
+    } catch (err) {
+      // The master canvas is tainted, e.g. by sprites from another origin:
+      // fall back on slicing it with drawImage
+      brain.planes.volume = null
+      return
+    }
+    // The pixels now live in the volume
+    brain.planes.canvasMaster.width = 0
+    brain.planes.canvasMaster.height = 0
+  }
+
+  // Copy a slice of the volume in the image data of its plane
+  const sliceVolume = function (type) {
+    const volume = brain.planes.volume; const width = brain.sprite.width
+    const nX = brain.nbSlice.X; const nY = brain.nbSlice.Y; const nZ = brain.nbSlice.Z
+    const image = brain.planes['pixels' + type]
+    let posW, posH, xx, yy, zz, offset
+
+    switch (type) {
+      case 'X':
+        // a block of the sprite
+        posW = (brain.numSlice.X % brain.nbCol)
+        posH = (brain.numSlice.X - posW) / brain.nbCol
+        for (zz = 0; zz < nZ; zz++) {
+          offset = (posH * nZ + zz) * width + posW * nY
+          image.set(volume.subarray(offset, offset + nY), zz * nY)
+        }
+        break
+
+      case 'Y':
+        // one column in each block of the sprite
+        for (xx = 0; xx < nX; xx++) {
+          posW = (xx % brain.nbCol)
+          posH = (xx - posW) / brain.nbCol
+          offset = posH * nZ * width + posW * nY + brain.numSlice.Y
+          for (zz = 0; zz < nZ; zz++) {
+            image[zz * nX + xx] = volume[offset + zz * width]
+          }
+        }
+        break
+
+      case 'Z':
+        // one row in each block of the sprite, rotated by 90 degrees
+        for (xx = 0; xx < nX; xx++) {
+          posW = (xx % brain.nbCol)
+          posH = (xx - posW) / brain.nbCol
+          offset = (posH * nZ + nZ - brain.numSlice.Z - 1) * width + posW * nY
+          for (yy = 0; yy < nY; yy++) {
+            image[(nY - yy - 1) * nX + xx] = volume[offset + yy]
+          }
+        }
+    }
+    brain.planes['context' + type].putImageData(brain.planes['image' + type], 0, 0)
+  }
+
+  //* *****************************************************//
+  // Merge background and overlay in the master canvas //
+  //* *****************************************************//
+  brain.compose = function () {
+    if (brain.planes.composed) {
+      return
+    }
+    brain.planes.canvasMaster.width = brain.sprite.width
+    brain.planes.canvasMaster.height = brain.sprite.height
+    brain.planes.contextMaster.globalAlpha = 1
+    brain.planes.contextMaster.drawImage(brain.sprite,
+      0, 0, brain.sprite.width, brain.sprite.height,
+      0, 0, brain.sprite.width, brain.sprite.height)
+    if (brain.overlay) {
+      // Draw the overlay on a canvas
+      brain.planes.contextMaster.globalAlpha = brain.overlay.opacity
+      brain.planes.contextMaster.drawImage(brain.overlay.sprite,
+        0, 0, brain.overlay.sprite.width, brain.overlay.sprite.height,
+        0, 0, brain.sprite.width, brain.sprite.height)
+    };
+    readVolume()
+    brain.planes.composed = true
+
+    // Look up the value at the current voxel, which reads the sprite pixels
+    updateValue()
+  }
+
+  // Free the memory of the master canvas and of the pixels of the overlay,
+  // they get composed and read again when needed
+  brain.release = function () {
+    brain.planes.canvasMaster.width = 0
+    brain.planes.canvasMaster.height = 0
+    brain.planes.volume = null
+    brain.planes.composed = false
+    if (brain.overlay) {
+      brain.overlay.pixels = null
+    }
+  }
+
   //* ******************//
   // Resize the viewer //
   //* ******************//
@@ -359,9 +525,88 @@ function brainsprite (params) { // eslint-disable-line no-unused-vars
     // fonts
     brain.context.font = brain.sizeFontPixels + 'px Arial'
 
+    brain.drawAnnotations()
+
     return true
   }
 
+  //* ******************************************************//
+  // Draw the static annotations in their in-memory canvas //
+  //* ******************************************************//
+  brain.drawAnnotations = function () {
+    const context = brain.contextAnnotations
+    const widthXY = brain.widthCanvas.X + brain.widthCanvas.Y
+
+    // Resizing the canvas clears it, and resets the font
+    brain.canvasAnnotations.width = brain.canvas.width
+    brain.canvasAnnotations.height = brain.canvas.height
+    context.imageSmoothingEnabled = brain.smooth
+    context.font = brain.sizeFontPixels + 'px Arial'
+    context.fillStyle = brain.colorFont
+
+    // Draw the title
+    if (brain.title) {
+      context.fillText(brain.title,
+        Math.round(brain.widthCanvas.X / 10),
+        Math.round((brain.heightCanvas.max * brain.heightColorBar) +
+                      brain.sizeFontPixels / 4))
+    }
+    // Each slice covers what overflows from the previous one
+    context.clearRect(brain.widthCanvas.X, 0, brain.widthCanvas.Y + brain.widthCanvas.Z,
+      brain.canvas.height)
+
+    // Add colorbar
+    if ((brain.colorMap) && (!brain.colorMap.hide)) {
+      // draw the colorMap on the coronal slice at screen resolution
+      context.drawImage(brain.colorMap.img,
+        0, 0, brain.colorMap.img.width, 1, Math.round(brain.widthCanvas.X +
+        brain.widthCanvas.Y * 0.2), Math.round(brain.heightCanvas.max *
+        brain.heightColorBar / 2), Math.round(brain.widthCanvas.Y * 0.6),
+        Math.round(brain.heightCanvas.max * brain.heightColorBar))
+      const labelMin = displayFloat(brain.colorMap.min, brain.nbDecimals)
+      const labelMax = displayFloat(brain.colorMap.max, brain.nbDecimals)
+      context.fillText(labelMin, brain.widthCanvas.X +
+        (brain.widthCanvas.Y * 0.2) -
+        context.measureText(labelMin).width / 2,
+      Math.round((brain.heightCanvas.max * brain.heightColorBar * 2) +
+        (3 / 4) * (brain.sizeFontPixels)))
+      context.fillText(labelMax, brain.widthCanvas.X +
+        (brain.widthCanvas.Y * 0.8) -
+        context.measureText(labelMax).width / 2,
+      Math.round((brain.heightCanvas.max * brain.heightColorBar * 2) +
+        (3 / 4) * (brain.sizeFontPixels)))
+    }
+
+    if (brain.showLR) {
+      const labelLeft = brain.radiological ? 'R' : 'L'
+      const labelRight = brain.radiological ? 'L' : 'R'
+      const paddingTop = Math.round(0.22 * brain.canvas.height)
+      const paddingRatio = 0.05 // 5% from each side
+      context.textAlign = 'center'
+      context.textBaseline = 'middle'
+
+      // On the coronal slice
+      let offsetX = brain.widthCanvas.Y * paddingRatio
+      context.fillText(labelLeft, brain.widthCanvas.X + offsetX, paddingTop)
+      context.fillText(labelRight, widthXY - offsetX, paddingTop)
+      context.clearRect(widthXY, 0, brain.widthCanvas.Z, brain.canvas.height)
+
+      // On the axial slice
+      offsetX = brain.widthCanvas.Z * paddingRatio
+      context.fillText(labelLeft, widthXY + offsetX, paddingTop)
+      context.fillText(labelRight, widthXY + brain.widthCanvas.Z - offsetX, paddingTop)
+    } else {
+      context.clearRect(widthXY, 0, brain.widthCanvas.Z, brain.canvas.height)
+    }
+  }
+
+  // Copy the static annotations of a slice on the main canvas
+  const blitAnnotations = function (left, width) {
+    brain.context.drawImage(brain.canvasAnnotations,
+      left, 0, width, brain.canvas.height,
+      left, 0, width, brain.canvas.height)
+  }
+
   //* **************************************//
   // Draw a particular slice in the canvas //
   //* **************************************//
@@ -377,11 +622,15 @@ function brainsprite (params) { // eslint-disable-line no-unused-vars
     switch (type) {
       case 'X':
         // Draw a sagittal slice in memory
-        pos.XW = ((brain.numSlice.X) % brain.nbCol)
-        pos.XH = (brain.numSlice.X - pos.XW) / brain.nbCol
-        brain.planes.contextX.drawImage(brain.planes.canvasMaster,
-          pos.XW * nY, pos.XH * nZ, nY, nZ,
-          0, 0, nY, nZ)
+        if (brain.planes.volume) {
+          sliceVolume('X')
+        } else {
+          pos.XW = ((brain.numSlice.X) % brain.nbCol)
+          pos.XH = (brain.numSlice.X - pos.XW) / brain.nbCol
+          brain.planes.contextX.drawImage(brain.planes.canvasMaster,
+            pos.XW * nY, pos.XH * nZ, nY, nZ,
+            0, 0, nY, nZ)
+        }
 
         // Add a crosshair
         if (brain.crosshair) {
@@ -402,13 +651,7 @@ function brainsprite (params) { // eslint-disable-line no-unused-vars
           brain.widthCanvas.X, brain.heightCanvas.X)
 
         // Draw the title
-        if (brain.title) {
-          brain.context.fillStyle = brain.colorFont
-          brain.context.fillText(brain.title,
-            Math.round(brain.widthCanvas.X / 10),
-            Math.round((brain.heightCanvas.max * brain.heightColorBar) +
-                          brain.sizeFontPixels / 4))
-        }
+        blitAnnotations(0, brain.widthCanvas.X)
 
         // Draw the value at current voxel
         if (brain.flagValue) {
@@ -434,12 +677,16 @@ function brainsprite (params) { // eslint-disable-line no-unused-vars
         brain.context.fillStyle = brain.colorBackground
         brain.context.fillRect(brain.widthCanvas.X, 0, brain.widthCanvas.Y,
           brain.canvas.height)
-        for (xx = 0; xx < brain.nbSlice.X; xx++) {
-          const posW = (xx % brain.nbCol)
-          const posH = (xx - posW) / brain.nbCol
-          brain.planes.contextY.drawImage(brain.planes.canvasMaster,
-            posW * brain.nbSlice.Y + brain.numSlice.Y, posH * brain.nbSlice.Z,
-            1, brain.nbSlice.Z, xx, 0, 1, brain.nbSlice.Z)
+        if (brain.planes.volume) {
+          sliceVolume('Y')
+        } else {
+          for (xx = 0; xx < brain.nbSlice.X; xx++) {
+            const posW = (xx % brain.nbCol)
+            const posH = (xx - posW) / brain.nbCol
+            brain.planes.contextY.drawImage(brain.planes.canvasMaster,
+              posW * brain.nbSlice.Y + brain.numSlice.Y, posH * brain.nbSlice.Z,
+              1, brain.nbSlice.Z, xx, 0, 1, brain.nbSlice.Z)
+          }
         }
 
         // Add a crosshair
@@ -457,32 +704,11 @@ function brainsprite (params) { // eslint-disable-line no-unused-vars
           (brain.heightCanvas.max - brain.heightCanvas.Y) / 2,
           brain.widthCanvas.Y, brain.heightCanvas.Y)
 
-        // Add colorbar
-        if ((brain.colorMap) && (!brain.colorMap.hide)) {
-          // draw the colorMap on the coronal slice at screen resolution
-          brain.context.drawImage(brain.colorMap.img,
-            0, 0, brain.colorMap.img.width, 1, Math.round(brain.widthCanvas.X +
-            brain.widthCanvas.Y * 0.2), Math.round(brain.heightCanvas.max *
-            brain.heightColorBar / 2), Math.round(brain.widthCanvas.Y * 0.6),
-            Math.round(brain.heightCanvas.max * brain.heightColorBar))
-          brain.context.fillStyle = brain.colorFont
-          const labelMin = displayFloat(brain.colorMap.min, brain.nbDecimals)
-          const labelMax = displayFloat(brain.colorMap.max, brain.nbDecimals)
-          brain.context.fillText(labelMin, brain.widthCanvas.X +
-            (brain.widthCanvas.Y * 0.2) -
-            brain.context.measureText(labelMin).width / 2,
-          Math.round((brain.heightCanvas.max * brain.heightColorBar * 2) +
-            (3 / 4) * (brain.sizeFontPixels)))
-          brain.context.fillText(labelMax, brain.widthCanvas.X +
-            (brain.widthCanvas.Y * 0.8) -
-            brain.context.measureText(labelMax).width / 2,
-          Math.round((brain.heightCanvas.max * brain.heightColorBar * 2) +
-            (3 / 4) * (brain.sizeFontPixels)))
-        }
+        // Add colorbar and left/right labels
+        blitAnnotations(brain.widthCanvas.X, brain.widthCanvas.Y)
 
         // Add Y coordinates on the slice
         if (brain.flagCoordinates) {
-          brain.context.font = brain.sizeFontPixels + 'px Arial'
           brain.context.fillStyle = brain.colorFont
           coord = 'y = ' + Math.round(brain.coordinatesSlice.Y)
           coordWidth = brain.context.measureText(coord).width
@@ -491,32 +717,6 @@ function brainsprite (params) { // eslint-disable-line no-unused-vars
           Math.round(brain.canvas.height - (brain.sizeFontPixels / 2)))
         }
 
-        if (brain.showLR) {
-          const isRadiological = !!brain.radiological
-
-          const paddingTop = Math.round(0.22 * brain.canvas.height)
-
-          const { font, textAlign, textBaseline } = brain.context
-
-          brain.context.font = `${brain.sizeFontPixels}px Arial`
-          brain.context.textAlign = 'center'
-          brain.context.textBaseline = 'middle'
-          brain.context.fillStyle = brain.colorFont
-
-          const labelLeft = isRadiological ? 'R' : 'L'
-          const labelRight = isRadiological ? 'L' : 'R'
-
-          const paddingRatio = 0.05 // 5% from each side
-          const offsetX = brain.widthCanvas.Y * paddingRatio
-
-          brain.context.fillText(labelLeft, brain.widthCanvas.X + offsetX, paddingTop)
-          brain.context.fillText(labelRight, brain.widthCanvas.X + brain.widthCanvas.Y - offsetX, paddingTop)
-
-          brain.context.font = font
-          brain.context.textAlign = textAlign
-          brain.context.textBaseline = textBaseline
-        }
-
         break
 
       case 'Z':
@@ -524,12 +724,16 @@ function brainsprite (params) { // eslint-disable-line no-unused-vars
         brain.context.fillStyle = brain.colorBackground
         brain.context.fillRect(brain.widthCanvas.X + brain.widthCanvas.Y, 0,
           brain.widthCanvas.Z, brain.canvas.height)
-        for (xx = 0; xx < brain.nbSlice.X; xx++) {
-          const posW = (xx % brain.nbCol)
-          const posH = (xx - posW) / brain.nbCol
-          brain.planes.contextZ.drawImage(brain.planes.canvasMaster,
-            posW * brain.nbSlice.Y, posH * brain.nbSlice.Z + brain.nbSlice.Z -
-            brain.numSlice.Z - 1, brain.nbSlice.Y, 1, 0, xx, brain.nbSlice.Y, 1)
+        if (brain.planes.volume) {
+          sliceVolume('Z')
+        } else {
+          for (xx = 0; xx < brain.nbSlice.X; xx++) {
+            const posW = (xx % brain.nbCol)
+            const posH = (xx - posW) / brain.nbCol
+            brain.planes.contextZ.drawImage(brain.planes.canvasMaster,
+              posW * brain.nbSlice.Y, posH * brain.nbSlice.Z + brain.nbSlice.Z -
+              brain.numSlice.Z - 1, brain.nbSlice.Y, 1, 0, xx, brain.nbSlice.Y, 1)
+          }
         }
 
         // Add a crosshair
@@ -547,6 +751,9 @@ function brainsprite (params) { // eslint-disable-line no-unused-vars
           brain.widthCanvas.Y, (brain.heightCanvas.max -
           brain.heightCanvas.Z) / 2, brain.widthCanvas.Z, brain.heightCanvas.Z)
 
+        // Add left/right labels
+        blitAnnotations(brain.widthCanvas.X + brain.widthCanvas.Y, brain.widthCanvas.Z)
+
         // Add Z coordinates on the slice
         if (brain.flagCoordinates) {
           coord = 'z = ' + Math.round(brain.coordinatesSlice.Z)
@@ -556,32 +763,6 @@ function brainsprite (params) { // eslint-disable-line no-unused-vars
           brain.widthCanvas.Y + (brain.widthCanvas.Z / 2) - coordWidth / 2,
           Math.round(brain.canvas.height - (brain.sizeFontPixels / 2)))
         }
-
-        if (brain.showLR) {
-          const isRadiological = !!brain.radiological
-
-          const paddingTop = Math.round(0.22 * brain.canvas.height)
-
-          const { font, textAlign, textBaseline } = brain.context
-
-          brain.context.font = `${brain.sizeFontPixels}px Arial`
-          brain.context.textAlign = 'center'
-          brain.context.textBaseline = 'middle'
-          brain.context.fillStyle = brain.colorFont
-
-          const labelLeft = isRadiological ? 'R' : 'L'
-          const labelRight = isRadiological ? 'L' : 'R'
-
-          const paddingRatio = 0.05 // 5% from each side
-          const offsetX = brain.widthCanvas.Z * paddingRatio
-
-          brain.context.fillText(labelLeft, brain.widthCanvas.X + brain.widthCanvas.Y + offsetX, paddingTop)
-          brain.context.fillText(labelRight, brain.widthCanvas.X + brain.widthCanvas.Y + brain.widthCanvas.Z - offsetX, paddingTop)
-
-          brain.context.font = font
-          brain.context.textAlign = textAlign
-          brain.context.textBaseline = textBaseline
-        }
     }
   }
 
@@ -591,6 +772,12 @@ function brainsprite (params) { // eslint-disable-line no-unused-vars
     let xx = e.clientX - rect.left
     const yy = e.clientY - rect.top
     let sy, sz
+    const previous = {
+      X: brain.numSlice.X,
+      Y: brain.numSlice.Y,
+      Z: brain.numSlice.Z,
+      value: brain.voxelValue
+    }
 
     if (xx < brain.widthCanvas.X) {
       sy = Math.round((brain.nbSlice.Y - 1) * (xx / brain.widthCanvas.X))
@@ -619,17 +806,79 @@ function brainsprite (params) { // eslint-disable-line no-unused-vars
     // Update coordinates
     updateCoordinates()
 
-    // Redraw slices
-    brain.drawAll()
+    // Redraw the slices which changed, at the next frame
+    brain.requestDraw(changedPlanes(previous))
     if (brain.onclick) {
       brain.onclick(e)
     };
   }
 
+  // Find the planes to redraw after the cut has moved from previous
+  const changedPlanes = function (previous) {
+    const moved = {}
+    for (const type of ['X', 'Y', 'Z']) {
+      moved[type] = previous[type] !== brain.numSlice[type]
+    }
+    // The value is displayed on the sagittal slice
+    const newValue = brain.flagValue && !Object.is(previous.value, brain.voxelValue)
+    return ['X', 'Y', 'Z'].filter(function (type) {
+      // The crosshair of a slice shows the cuts of the other planes
+      const others = ['X', 'Y', 'Z'].filter(function (other) { return other !== type })
+      return moved[type] ||
+        (brain.crosshair && (moved[others[0]] || moved[others[1]])) ||
+        (type === 'X' && newValue)
+    })
+  }
+
+  //* *********************************************//
+  // Schedule redraws, at most once per frame //
+  //* *********************************************//
+  brain.dirty = { X: false, Y: false, Z: false }
+  brain.frameTime = { count: 0, total: 0, last: 0, max: 0 }
+  let frameRequested = false
+
+  brain.requestDraw = function (types) {
+    for (const type of types) {
+      brain.dirty[type] = true
+    }
+    if (typeof window.requestAnimationFrame !== 'function') {
+      brain.flush()
+    } else if (!frameRequested && types.length > 0) {
+      frameRequested = true
+      window.requestAnimationFrame(brain.flush)
+    }
+  }
+
+  // Redraw the dirty planes, and record the time spent doing so (in ms)
+  brain.flush = function () {
+    frameRequested = false
+    if (!brain.visible) {
+      return
+    }
+    const start = performance.now()
+    brain.compose()
+    for (const type of ['X', 'Y', 'Z']) {
+      if (brain.dirty[type]) {
+        brain.draw(brain.numSlice[type], type)
+        brain.dirty[type] = false
+      }
+    }
+    const elapsed = performance.now() - start
+    brain.frameTime.count++
+    brain.frameTime.total += elapsed
+    brain.frameTime.last = elapsed
+    brain.frameTime.max = Math.max(brain.frameTime.max, elapsed)
+  }
+
   brain.drawAll = function () {
+    if (!brain.visible) {
+      return
+    }
+    brain.compose()
     brain.draw(brain.numSlice.X, 'X')
     brain.draw(brain.numSlice.Y, 'Y')
     brain.draw(brain.numSlice.Z, 'Z')
+    brain.dirty = { X: false, Y: false, Z: false }
   }
 
   // Attach a listener for clicks
@@ -650,16 +899,46 @@ function brainsprite (params) { // eslint-disable-line no-unused-vars
     brain.init()
     brain.drawAll()
   })
+  if (brain.colorMap) {
+    brain.colorMap.img.addEventListener('load', function () {
+      brain.drawAnnotations()
+      brain.drawAll()
+    })
+  }
   if (brain.overlay) {
     brain.overlay.sprite.addEventListener('load', function () {
       brain.init()
       brain.drawAll()
     })
+    if (brain.overlay.values) {
+      brain.overlay.values.sprite.addEventListener('load', function () {
+        brain.init()
+        brain.drawAll()
+      })
+    }
   }
 
   // Init the viewer
   brain.init()
 
+  // In lazy mode, only draw the viewer while it is visible
+  brain.visible = true
+  if (brain.lazy && ('IntersectionObserver' in window)) {
+    brain.visible = false
+    let timerRelease = null
+    brain.observer = new IntersectionObserver(function (entries) {
+      const entry = entries[entries.length - 1]
+      brain.visible = entry.isIntersecting
+      if (brain.visible) {
+        clearTimeout(timerRelease)
+        brain.drawAll()
+      } else {
+        timerRelease = setTimeout(brain.release, brain.releaseDelay)
+      }
+    })
+    brain.observer.observe(brain.canvas)
+  }
+
   // Draw all slices
   brain.drawAll()
 
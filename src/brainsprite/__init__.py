@@ -1,5 +1,5 @@
 """Brainsprite python API."""
 
-from brainsprite.brainsprite import viewer_substitute
+from brainsprite.brainsprite import clear_cache, make_page, viewer_substitute, write_page
 
-__all__ = ["viewer_substitute"]
+__all__ = ["clear_cache", "make_page", "viewer_substitute", "write_page"]
@@ -0,0 +1,95 @@
+"""Content-addressed on-disk cache for the stages of brainsprite viewers."""
+
+import hashlib
+import pickle
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+
+def _hash(*parts):
+    """Hash a series of numpy arrays and python objects.
+    Returns: key (hexadecimal string).
+    Arrays are hashed based on their dtype, shape and content, other objects
+    based on their repr.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            part = np.ascontiguousarray(part)
+            digest.update(f"{part.dtype.str}{part.shape}".encode())
+            digest.update(part.view(np.uint8).ravel())
+        else:
+            digest.update(repr(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class _DiskCache:
+    """Store python objects in a directory, one pickle file per key.
+
+    Files are touched each time they are read, and the least recently used
+    files are evicted when the total size of the cache exceeds max_bytes.
+    Writes are atomic, so that the cache can be shared across processes.
+
+    :param cache_dir: The directory of the cache, created if needed.
+    :type cache_dir: str or pathlib.Path
+    :param max_bytes: The maximal size of the cache, in bytes.
+        If None, the size of the cache is not limited.
+    :type max_bytes: int or None
+    """
+
+    suffix = ".pkl"
+
+    def __init__(self, cache_dir, max_bytes=None):
+        """Set up the cache directory and counters."""
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return self.cache_dir / f"{key}{self.suffix}"
+
+    def get(self, key):
+        """Read an object from the cache.
+        Returns: the object, or None if key is not in the cache.
+        """
+        path = self._path(key)
+        try:
+            with path.open("rb") as f:
+                value = pickle.load(f)
+            path.touch()
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Write an object in the cache, and evict old entries if needed."""
+        with tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix=".tmp", delete=False) as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        Path(f.name).replace(self._path(key))
+        if self.max_bytes is not None:
+            self.evict()
+
+    def evict(self):
+        """Delete the least recently used entries, until the size of the cache
+        is below max_bytes.
+        """
+        entries = []
+        for path in self.cache_dir.glob(f"*{self.suffix}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
@@ -0,0 +1,231 @@
+"""Command line tool to render brainsprite viewers for a series of stat maps."""
+
+import argparse
+import copy
+import glob
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+from joblib import Parallel, delayed
+
+from brainsprite._cache import _hash
+from brainsprite.brainsprite import _fit_viewer, viewer_substitute, write_page
+
+# Extensions of the volumes, stripped to name the html pages
+_EXTENSIONS = re.compile(r"\.(nii|img|hdr|mgz)(\.gz)?$")
+
+# File of the output directory recording the rendering options of each page
+_RECORD = ".brainsprite.json"
+
+
+def _threshold(value):
+    """Parse the threshold option.
+    Returns: threshold (float or 'auto').
+    """
+    return value if value == "auto" else float(value)
+
+
+def _parser():
+    """Define the arguments of the command line tool.
+    Returns: parser.
+    """
+    parser = argparse.ArgumentParser(
+        prog="brainsprite",
+        description=(
+            "Render a brainsprite viewer for each stat map, as a standalone html page. "
+            "Pages newer than their stat map and background, and rendered with the "
+            "same options, are skipped."
+        ),
+    )
+    parser.add_argument(
+        "stat_maps", nargs="*", help="stat maps, or glob patterns (e.g. 'maps/**/*.nii.gz')"
+    )
+    parser.add_argument("-m", "--manifest", help="a text file listing stat maps, one per line")
+    parser.add_argument("-o", "--output-dir", required=True, help="the directory of the html pages")
+    parser.add_argument(
+        "--bg-img",
+        default="MNI152",
+        help="the background image, 'MNI152' (default) or 'none'",
+    )
+    parser.add_argument(
+        "--threshold", type=_threshold, default=1e-6, help="a number or 'auto' (default 1e-6)"
+    )
+    parser.add_argument("--radiological", action="store_true", help="use radiological views")
+    parser.add_argument(
+        "--dtype",
+        choices=["auto", "float32", "preserve"],
+        default="auto",
+        help="the dtype of the data through the stages (default auto)",
+    )
+    parser.add_argument("--cache-dir", help="cache the stages of the viewers in this directory")
+    parser.add_argument(
+        "-j", "--n-jobs", type=int, default=1, help="number of worker processes (-1: all CPUs)"
+    )
+    parser.add_argument(
+        "-f", "--force", action="store_true", help="render pages which are up to date"
+    )
+    return parser
+
+
+def _stat_maps(patterns, manifest=None):
+    """List the stat maps matching glob patterns, and listed in a manifest.
+    Blank lines and lines starting with # are ignored in the manifest, and
+    relative paths are relative to the manifest.
+    Returns: stat_maps (list of paths, without duplicates).
+    """
+    paths = []
+    for pattern in patterns:
+        # Path.glob does not support absolute patterns
+        matches = sorted(glob.glob(pattern, recursive=True))  # noqa: PTH207
+        if not matches:
+            raise ValueError(f"No stat map matches {pattern}.")
+        paths.extend(matches)
+    if manifest is not None:
+        manifest = Path(manifest)
+        for line in manifest.read_text(encoding="utf-8").splitlines():
+            line = line.strip()
+            if line and not line.startswith("#"):
+                paths.append(manifest.parent / line)
+    return list(dict.fromkeys(Path(path) for path in paths))
+
+
+def _options(args, bg_img):
+    """Hash the options which change the rendering of the pages.
+    Returns: options (hexadecimal string).
+    """
+    return _hash("page", args.threshold, args.radiological, args.dtype, bg_img)
+
+
+def _read_record(output_dir):
+    """Read the rendering options of the pages of an output directory.
+    Returns: record (dictionary of options, indexed by page name).
+    """
+    try:
+        record = json.loads((output_dir / _RECORD).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return record if isinstance(record, dict) else {}
+
+
+def _write_record(output_dir, record):
+    """Write the rendering options of the pages of an output directory."""
+    path = output_dir / _RECORD
+    partial = path.with_name(path.name + ".tmp")
+    partial.write_text(json.dumps(record, indent=1, sort_keys=True), encoding="utf-8")
+    partial.replace(path)
+
+
+def _up_to_date(output, sources):
+    """Check whether an output file is newer than all of its sources."""
+    if not output.exists():
+        return False
+    mtime = output.stat().st_mtime
+    return all(source.stat().st_mtime <= mtime for source in sources)
+
+
+def _jobs(stat_maps, output_dir, bg_img, options, force=False):
+    """Name the html page of each stat map, and skip the pages up to date,
+    i.e. newer than their sources and rendered with the same options.
+    Returns: jobs (list of stat map and page), skipped (number of pages).
+    """
+    outputs = {}
+    for stat_map in stat_maps:
+        output = output_dir / (_EXTENSIONS.sub("", stat_map.name) + ".html")
+        if output in outputs:
+            raise ValueError(
+                f"The stat maps {outputs[output]} and {stat_map} would both be "
+                f"rendered in {output}. Rename the stat maps, or render them "
+                "in separate output directories."
+            )
+        outputs[output] = stat_map
+
+    sources = [Path(bg_img)] if isinstance(bg_img, str) and Path(bg_img).is_file() else []
+    record = _read_record(output_dir)
+    jobs = [
+        (stat_map, output)
+        for output, stat_map in outputs.items()
+        if force
+        or record.get(output.name) != options
+        or not _up_to_date(output, [stat_map, *sources])
+    ]
+    return jobs, len(outputs) - len(jobs)
+
+
+def _render(viewer, stat_map, output, bg_img, background):
+    """Fit a viewer, and write it in a standalone html page. The page is
+    written in a temporary file first, so that an interrupted run never
+    leaves a partial page which looks up to date.
+    Returns: size of the page (bytes).
+    """
+    _fit_viewer(viewer, str(stat_map), bg_img, background)
+    partial = output.with_name(output.name + ".tmp")
+    write_page(partial, [viewer], title=output.stem, lazy=False)
+    partial.replace(output)
+    return output.stat().st_size
+
+
+def _render_all(bsprite, jobs, bg_img, n_jobs, output_dir, options):
+    """Render the pages of a series of jobs over a pool of worker processes,
+    and record the options they were rendered with.
+    Returns: size of the pages written (bytes).
+    """
+    # The background is loaded and encoded once, and shared by all viewers
+    background = None
+    if jobs and bg_img is not False:
+        background = bsprite._fit_background(None, bg_img, bsprite._cache())
+    sizes = Parallel(n_jobs=n_jobs, return_as="generator")(
+        delayed(_render)(copy.copy(bsprite), stat_map, output, bg_img, background)
+        for stat_map, output in jobs
+    )
+    written = 0
+    record = _read_record(output_dir)
+    try:
+        for (_, output), size in zip(jobs, sizes, strict=True):
+            print(f"{output} ({size / 1e6:.2f} MB)")
+            written += size
+            record[output.name] = options
+    finally:
+        # Record the options of the pages rendered, even if the run is interrupted
+        if jobs:
+            _write_record(output_dir, record)
+    return written
+
+
+def main(argv=None):
+    """Render a brainsprite viewer for each stat map, in a standalone html page."""
+    parser = _parser()
+    args = parser.parse_args(argv)
+    output_dir = Path(args.output_dir)
+    bg_img = False if args.bg_img.lower() == "none" else args.bg_img
+    options = _options(args, bg_img)
+    try:
+        stat_maps = _stat_maps(args.stat_maps, args.manifest)
+        jobs, skipped = _jobs(stat_maps, output_dir, bg_img, options, args.force)
+    except ValueError as e:
+        parser.error(str(e))
+    if not stat_maps:
+        parser.error("no stat map was specified")
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    bsprite = viewer_substitute(
+        threshold=args.threshold,
+        radiological=args.radiological,
+        dtype=args.dtype,
+        cache_dir=args.cache_dir,
+    )
+    start = time.perf_counter()
+    written = _render_all(bsprite, jobs, bg_img, args.n_jobs, output_dir, options)
+    elapsed = time.perf_counter() - start
+
+    rate = len(jobs) / elapsed if jobs else 0.0
+    print(
+        f"Rendered {len(jobs)} viewers in {elapsed:.1f} s ({rate:.2f} viewers/s), "
+        f"{written / 1e6:.1f} MB written, {skipped} up to date"
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
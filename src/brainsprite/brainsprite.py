@@ -1,58 +1,134 @@
 """Python interface for the brainsprite.js library."""
 
+import copy
+import functools
+import hashlib
+import re
+import struct
+import tempfile
+import threading
+import time
 import warnings
+import zlib
 from base64 import b64encode
-from io import BytesIO
+from collections import OrderedDict
+from io import BytesIO, StringIO
 from pathlib import Path
 
 import numpy as np
-import tempita
-from matplotlib.image import imsave
-from nibabel.affines import apply_affine
-from nilearn._utils.extmath import fast_abs_percentile
-from nilearn._utils.html_document import HTMLDocument
-from nilearn._utils.niimg import safe_get_data
-from nilearn._utils.niimg_conversions import check_niimg_3d
-from nilearn._utils.param_validation import check_threshold
-from nilearn.datasets import load_mni152_template
-from nilearn.image import new_img_like, reorder_img, resample_to_img
-from nilearn.plotting import cm
-from nilearn.plotting._engine_utils import colorscale
-from nilearn.plotting.find_cuts import find_xyz_cut_coords
-from nilearn.plotting.image.utils import load_anat
-
-
-def _data_to_sprite(data, radiological=False):
+from joblib import Parallel, delayed
+
+from brainsprite._cache import _DiskCache, _hash
+
+# matplotlib, nilearn, scipy and tempita are slow to import. They are
+# imported by the stages which need them, so that importing brainsprite
+# stays fast.
+
+# Memo of prepared MNI152 backgrounds, see clear_cache
+_BACKGROUND_MEMO = OrderedDict()
+_BACKGROUND_MEMO_LOCK = threading.Lock()
+_BACKGROUND_MEMO_SIZE = 8
+
+# PNG color types, and number of entries in a PNG palette
+_PNG_GRAY = 0
+_PNG_PALETTE = 3
+_PNG_RGBA = 6
+_PNG_PALETTE_SIZE = 256
+_OPAQUE = 255
+
+# Load the brainsprite.js library saved in a file, from a viewer snippet.
+# While the page is parsed, document.write loads the library synchronously,
+# before the next scripts run. Afterwards, the library loads asynchronously.
+_LIBRARY_LOADER = """(function () {{
+  var url = "{url}";
+  if (document.readyState === "loading") {{
+    document.write('<script src="' + url + '"><\\/script>');
+    return;
+  }}
+  var script = document.createElement("script");
+  script.src = url;
+  document.head.appendChild(script);
+}})();
+"""
+
+# Number of bytes encoded at once when streaming base64, a multiple of 3
+_BASE64_CHUNK = 3 * 2**16
+
+# Spline order of the interpolation methods of nilearn.image.resample_img
+_INTERPOLATION_ORDER = {"continuous": 3, "linear": 1, "nearest": 0}
+
+# dtype of the stat map loaded by check_niimg_3d, for each dtype mode
+_LOAD_DTYPES = {"auto": "auto", "float32": np.float32, "preserve": None}
+
+# Number of quantization levels of the value channel, minus one
+_VALUE_LEVELS = {"uint8": 2**8 - 1, "uint16": 2**16 - 1}
+
+
+@functools.cache
+def _library():
+    """Read the brainsprite.js library, once per process.
+    If the unminified version is present, we rely on it
+    (useful for testing coverage in javascript).
+    Returns: library (str).
+    """
+    js_dir = Path(__file__).parent / "data" / "js"
+    if (js_dir / "brainsprite.js").exists():
+        with (js_dir / "brainsprite.js").open("r") as f:
+            return f.read()
+    with (js_dir / "brainsprite.min.js").open("r") as f:
+        return f.read()
+
+
+def _sprite_grid(nx):
+    """Compute the layout of a sprite of nx sagittal slices.
+    Returns: nrows, ncolumns.
+    """
+    nrows = int(np.ceil(np.sqrt(nx)))
+    ncolumns = int(np.ceil(nx / float(nrows)))
+    return nrows, ncolumns
+
+
+def _data_to_sprite(data, radiological=False, out=None):
     """Convert a 3D array into a sprite of sagittal slices.
     Returns: sprite (2D numpy array)
     If each sagittal slice is nz (height) x ny (width) pixels, the sprite
     size is (M x nz) x (N x ny), where M and N are computed to be roughly
     equal. All slices are pasted together row by row, from top left to
     bottom right. The last row is completed with empty slices.
+    The sprite has the dtype of data, unless a preallocated 2D array is
+    passed through out, in which case the sprite is written in place.
     """
     nx, ny, nz = data.shape
-    nrows = int(np.ceil(np.sqrt(nx)))
-    ncolumns = int(np.ceil(nx / float(nrows)))
+    nrows, ncolumns = _sprite_grid(nx)
 
-    sprite = np.zeros((nrows * nz, ncolumns * ny))
-    indrow, indcol = np.where(np.ones((nrows, ncolumns)))
+    if out is None:
+        out = np.empty((nrows * nz, ncolumns * ny), dtype=data.dtype)
+    elif out.shape != (nrows * nz, ncolumns * ny) or not out.flags.c_contiguous:
+        raise ValueError(
+            f"The output buffer needs to be a C-contiguous array of shape "
+            f"{(nrows * nz, ncolumns * ny)}. You provided an array of shape {out.shape}."
+        )
 
+    # Each sagittal slice is flipped in the z axis and transposed, so that
+    # superior is at the top of the tile. In radiological view, the order
+    # of the slices is reversed.
     if radiological:
-        for xx in range(nx):
-            # we need to flip the image in the x axis
-            sprite[
-                (indrow[xx] * nz) : ((indrow[xx] + 1) * nz),
-                (indcol[xx] * ny) : ((indcol[xx] + 1) * ny),
-            ] = data[nx - xx - 1, :, ::-1].transpose()
-    else:
-        for xx in range(nx):
-            # we need to flip the image in the x axis
-            sprite[
-                (indrow[xx] * nz) : ((indrow[xx] + 1) * nz),
-                (indcol[xx] * ny) : ((indcol[xx] + 1) * ny),
-            ] = data[xx, :, ::-1].transpose()
+        data = data[::-1]
+    data = data[:, :, ::-1]
 
-    return sprite
+    # View the sprite as a (row, z, column, y) grid of tiles, and copy all
+    # the complete rows of tiles in one go.
+    tiles = out.reshape(nrows, nz, ncolumns, ny)
+    nfull, nlast = divmod(nx, ncolumns)
+    tiles[:nfull] = data[: nfull * ncolumns].reshape(nfull, ncolumns, ny, nz).transpose(0, 3, 1, 2)
+
+    # Complete the last row of tiles with empty slices
+    if nfull < nrows:
+        tiles[nfull, :, :nlast] = data[nfull * ncolumns :].transpose(2, 0, 1)
+        tiles[nfull, :, nlast:] = 0
+        tiles[nfull + 1 :] = 0
+
+    return out
 
 
 def _threshold_data(data, threshold=None):
@@ -64,6 +140,9 @@ def _threshold_data(data, threshold=None):
         mask = np.full(data.shape, False)
         return data, mask, threshold
 
+    from nilearn._utils.extmath import fast_abs_percentile
+    from nilearn._utils.param_validation import check_threshold
+
     # Deal with automatic settings of plot parameters
     if threshold == "auto":
         # Threshold epsilon below a percentile value, to be sure that some
@@ -76,7 +155,7 @@ def _threshold_data(data, threshold=None):
     )
 
     # Mask data
-    mask = data == 0 if threshold == 0 else (data >= -threshold) & (data <= threshold)
+    mask = _threshold_mask(data, threshold)
     data = data * np.logical_not(mask)
     if not np.any(mask):
         warnings.warn(
@@ -88,6 +167,64 @@ def _threshold_data(data, threshold=None):
     return data, mask, threshold
 
 
+def _write_base64(handle, data, chunk_size=_BASE64_CHUNK):
+    """Encode bytes as base64 and write them to a text file, chunk by chunk."""
+    data = memoryview(data)
+    for start in range(0, len(data), chunk_size):
+        handle.write(b64encode(data[start : start + chunk_size]).decode("ascii"))
+
+
+def _load_template(file_template):
+    """Load a tempita template from a file.
+    Returns: template.
+    """
+    import tempita
+
+    return tempita.Template.from_filename(str(file_template), encoding="utf-8")
+
+
+def _split_template(template, namespace, streams):
+    """Substitute a tempita template, except for the names in streams, which
+    are left to be written separately.
+    Returns: parts, a list alternating text and names of streams.
+    """
+    markers = {name: f"\0{name}\0" for name in streams}
+    text = template.substitute({**namespace, **markers})
+    if not markers:
+        return [text]
+    return re.split("\0(" + "|".join(re.escape(name) for name in markers) + ")\0", text)
+
+
+def _bytes_io_to_bytes(handle_io):
+    """Read the content of a bytesIO virtual file.
+    Also closes the file.
+    Returns: data (bytes).
+    """
+    data = handle_io.getvalue()
+    handle_io.close()
+    return data
+
+
+def _asset_name(prefix, data, suffix=".png"):
+    """Name a file after a hash of its content.
+    Returns: file name.
+    """
+    return f"{prefix}-{hashlib.blake2b(data, digest_size=8).hexdigest()}{suffix}"
+
+
+def _write_asset(path, data):
+    """Write data in a file, unless it exists already. Files are named after
+    their content, so an existing file holds the same data. Writes are atomic,
+    so that viewers can share files across processes.
+    """
+    if path.exists():
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=path.parent, suffix=".tmp", delete=False) as f:
+        f.write(data)
+    Path(f.name).replace(path)
+
+
 def _bytes_io_to_base64(handle_io):
     """Encode the content of a bytesIO virtual file as base64.
     Also closes the file.
@@ -99,12 +236,23 @@ def _bytes_io_to_base64(handle_io):
     return data
 
 
-def _mask_stat_map(stat_map_img, threshold=None):
+def _mask_stat_map(stat_map_img, threshold=None, dtype="auto"):
     """Load a stat map and apply a threshold.
+    With dtype 'auto', the stat map is loaded as float32 or int32, with
+    'float32' as float32, and with 'preserve' in its own dtype.
     Returns: mask_img, stat_map_img, data, threshold.
     """
+    from nilearn._utils.niimg import safe_get_data
+    from nilearn._utils.niimg_conversions import check_niimg_3d
+    from nilearn.image import new_img_like
+
+    if dtype not in _LOAD_DTYPES:
+        raise ValueError(
+            f"dtype should be 'auto', 'float32' or 'preserve'. You provided dtype={dtype}"
+        )
+
     # Load stat map
-    stat_map_img = check_niimg_3d(stat_map_img, dtype="auto")
+    stat_map_img = check_niimg_3d(stat_map_img, dtype=_LOAD_DTYPES[dtype])
     data = safe_get_data(stat_map_img, ensure_finite=True)
 
     # threshold the stat_map
@@ -112,53 +260,238 @@ def _mask_stat_map(stat_map_img, threshold=None):
         data, mask, threshold = _threshold_data(data, threshold)
         mask_img = new_img_like(stat_map_img, mask, stat_map_img.affine)
     else:
-        mask_img = new_img_like(stat_map_img, np.zeros(data.shape), stat_map_img.affine)
+        mask_img = new_img_like(
+            stat_map_img, np.zeros(data.shape, dtype=np.uint8), stat_map_img.affine
+        )
     return mask_img, stat_map_img, data, threshold
 
 
-def _load_bg_img(stat_map_img, bg_img="MNI152", black_bg="auto", dim="auto"):
+def _load_bg_img(stat_map_img, bg_img="MNI152", black_bg="auto", dim="auto", dtype="auto"):
     """Load and resample bg_img in an isotropic resolution,
-    with a positive diagonal affine matrix.
+    with a positive diagonal affine matrix. With dtype 'float32', the
+    background is converted to float32.
     Returns: bg_img, bg_min, bg_max, black_bg.
     """
+    from nilearn.image import get_data, new_img_like, reorder_img
+
     if (bg_img is None or bg_img is False) and black_bg == "auto":
         black_bg = False
 
     if bg_img is not None and bg_img is not False:
+        from nilearn.plotting.image.utils import load_anat
+
         if isinstance(bg_img, str) and bg_img == "MNI152":
+            from nilearn.datasets import load_mni152_template
+
             bg_img = load_mni152_template()
         bg_img, black_bg, bg_min, bg_max = load_anat(bg_img, dim=dim, black_bg=black_bg)
     else:
-        bg_img = new_img_like(stat_map_img, np.zeros(stat_map_img.shape), stat_map_img.affine)
+        bg_img = new_img_like(
+            stat_map_img, np.zeros(stat_map_img.shape, dtype=np.uint8), stat_map_img.affine
+        )
         bg_min = 0
         bg_max = 0
     bg_img = reorder_img(bg_img, resample="nearest", copy_header=True)
+    if dtype == "float32" and get_data(bg_img).dtype != np.float32:
+        data = get_data(bg_img).astype(np.float32)
+        bg_img = new_img_like(bg_img, data, bg_img.affine, copy_header=True)
     return bg_img, bg_min, bg_max, black_bg
 
 
-def _resample_stat_map(stat_map_img, bg_img, mask_img, resampling_interpolation="continuous"):
-    """Resample the stat map and mask to the background.
-    Returns: stat_map_img, mask_img.
+def _threshold_mask(data, threshold):
+    """Find the values of data below a (numerical) threshold, in absolute value.
+    Returns: mask (boolean array).
     """
-    stat_map_img = resample_to_img(
-        stat_map_img,
-        bg_img,
-        interpolation=resampling_interpolation,
-        force_resample=True,
-        copy_header=True,
-    )
-    mask_img = resample_to_img(
-        mask_img,
-        bg_img,
-        fill_value=1,
-        interpolation="nearest",
-        force_resample=True,
-        copy_header=True,
+    if threshold == 0:
+        return data == 0
+    return (data >= -threshold) & (data <= threshold)
+
+
+def _source_coords(matrix, offset, x, grid):
+    """Map the sagittal slice x of a target volume onto the voxel coordinates
+    of a source volume, with an affine transform. The arithmetic is the one of
+    scipy.ndimage.affine_transform, so that interpolating at these
+    coordinates gives exactly the same values.
+    Returns: coords (3 x ny x nz array).
+    """
+    x = np.full(grid[0].shape, float(x))
+    if np.all(np.diag(np.diag(matrix)) == matrix):
+        zoom = np.diag(matrix)
+        shift = offset / zoom
+        return np.stack(
+            [
+                (x + shift[0]) * zoom[0],
+                (grid[0] + shift[1]) * zoom[1],
+                (grid[1] + shift[2]) * zoom[2],
+            ]
+        )
+    # The products are summed in the order of affine_transform, then shifted
+    return np.stack(
+        [
+            row[0] * x + row[1] * grid[0] + row[2] * grid[1] + shift
+            for row, shift in zip(matrix, offset, strict=True)
+        ]
     )
 
+
+def _resampling_transform(source_affine, target_affine):
+    """Compute the affine transform from the voxels of a target volume to the
+    voxels of a source volume, as nilearn.image.resample_img does. The
+    inverse of numpy rounds differently, which moves the voxels on the edges
+    of the source in or out of it.
+    Returns: matrix (3 x 3 array), offset (3 array).
+    """
+    from scipy import linalg
+
+    if np.all(source_affine == target_affine):
+        transform = np.eye(4)
+    else:
+        transform = linalg.inv(source_affine).dot(target_affine)
+    return transform[:3, :3], transform[:3, 3]
+
+
+def _interpolation_data(stat_map_img, order, dtype="auto"):
+    """Prepare a stat map for spline interpolation of a given order.
+    With dtype 'float32', the spline coefficients and the resampled data are
+    float32, rather than float64 and the dtype of the stat map.
+    Returns: data (spline coefficients for order > 1), dtype (of the resampled data).
+    """
+    from nilearn._utils.niimg import safe_get_data
+    from scipy import ndimage
+
+    data = safe_get_data(stat_map_img, ensure_finite=True)
+    coefficients = np.float64
+    if dtype == "float32":
+        coefficients = dtype = np.dtype(np.float32)
+    else:
+        dtype = data.dtype.newbyteorder("=")
+    if order == _INTERPOLATION_ORDER["continuous"] and dtype.kind == "i":
+        dtype = np.dtype(f"float{max(32, 8 * dtype.itemsize)}")
+    if order > 1:
+        # The spline coefficients are computed once for the whole volume
+        data = ndimage.spline_filter(data, order, output=coefficients, mode="constant")
+    return data, dtype
+
+
+def _check_resampling(resampling_interpolation, mask_resampling):
+    """Check the resampling parameters of _resample_stat_map."""
+    if resampling_interpolation not in _INTERPOLATION_ORDER:
+        raise ValueError(
+            "resampling_interpolation should be one of "
+            f"{sorted(_INTERPOLATION_ORDER)}. "
+            f"You provided resampling_interpolation={resampling_interpolation}"
+        )
+    if mask_resampling not in ("nearest", "threshold"):
+        raise ValueError(
+            "mask_resampling should be 'nearest' or 'threshold'. "
+            f"You provided mask_resampling={mask_resampling}"
+        )
+
+
+def _copy_stat_map(stat_map_img, mask_img, dtype="auto"):
+    """Copy a stat map and its mask, already in the space of the background.
+    With dtype 'float32', the stat map is converted to float32, as the
+    resampled ones are, see _interpolation_data.
+    Returns: stat_map_img, mask_img.
+    """
+    from nilearn.image import copy_img, get_data, new_img_like
+
+    stat_map_img = copy_img(stat_map_img)
+    if dtype == "float32" and get_data(stat_map_img).dtype != np.float32:
+        data = get_data(stat_map_img).astype(np.float32)
+        stat_map_img = new_img_like(stat_map_img, data, stat_map_img.affine, copy_header=True)
+    return stat_map_img, copy_img(mask_img)
+
+
+def _resample_stat_map(
+    stat_map_img,
+    bg_img,
+    mask_img,
+    resampling_interpolation="continuous",
+    threshold=None,
+    mask_resampling="nearest",
+    dtype="auto",
+):
+    """Resample the stat map and mask to the background, in a single pass.
+    The voxel coordinates of the stat map are computed once for each sagittal
+    slice of the background, and used to interpolate both the stat map and
+    the mask (with nearest neighbour interpolation, voxels outside of the
+    stat map being masked). The output is identical to two calls to
+    nilearn.image.resample_to_img.
+    With mask_resampling='threshold', the mask is not resampled, but
+    derived by applying the threshold to the resampled stat map.
+    See _interpolation_data for dtype.
+    Returns: stat_map_img, mask_img.
+    """
+    from nilearn.image import get_data, new_img_like
+    from scipy import ndimage
+
+    _check_resampling(resampling_interpolation, mask_resampling)
+    # Without threshold, there is nothing to re-apply after resampling
+    rethreshold = mask_resampling == "threshold" and threshold is not None
+
+    # The stat map is already in the space of the background
+    if stat_map_img.shape == bg_img.shape[:3] and np.array_equal(
+        stat_map_img.affine, bg_img.affine
+    ):
+        return _copy_stat_map(stat_map_img, mask_img, dtype)
+
+    matrix, offset = _resampling_transform(stat_map_img.affine, bg_img.affine)
+    order = _INTERPOLATION_ORDER[resampling_interpolation]
+    data, dtype = _interpolation_data(stat_map_img, order, dtype)
+    resampled = np.empty(bg_img.shape[:3], dtype=dtype)
+    if not rethreshold:
+        mask = np.asarray(get_data(mask_img))
+        resampled_mask = np.empty(bg_img.shape[:3], dtype=mask.dtype.newbyteorder("="))
+
+    grid = np.indices(bg_img.shape[1:3], dtype=np.float64)
+    for x in range(bg_img.shape[0]):
+        coords = _source_coords(matrix, offset, x, grid)
+        ndimage.map_coordinates(
+            data, coords, output=resampled[x], order=order, mode="constant", prefilter=False
+        )
+        if not rethreshold:
+            ndimage.map_coordinates(
+                mask, coords, output=resampled_mask[x], order=0, mode="constant", cval=1
+            )
+    if rethreshold:
+        resampled_mask = _threshold_mask(resampled, threshold)
+
+    stat_map_img = new_img_like(stat_map_img, resampled, bg_img.affine, copy_header=True)
+    mask_img = new_img_like(mask_img, resampled_mask, bg_img.affine, copy_header=True)
     return stat_map_img, mask_img
 
 
+def _bounding_box(bg_img, stat_map_img, mask_img):
+    """Find the bounding box of the nonzero voxels of the background, and of
+    the stat map outside of the mask.
+    Returns: box (tuple of slices), or None if all voxels are zero.
+    """
+    from nilearn.image import get_data
+
+    nonzero = get_data(bg_img) != 0
+    nonzero |= (get_data(stat_map_img) != 0) & np.logical_not(get_data(mask_img))
+    if not np.any(nonzero):
+        return None
+    box = []
+    for axis in range(3):
+        index = np.flatnonzero(np.any(nonzero, axis=tuple(a for a in range(3) if a != axis)))
+        box.append(slice(int(index[0]), int(index[-1]) + 1))
+    return tuple(box)
+
+
+def _crop_img(img, box):
+    """Crop an image to a box of voxels, preserving world coordinates.
+    Returns: img.
+    """
+    from nibabel.affines import apply_affine
+    from nilearn.image import get_data, new_img_like
+
+    affine = img.affine.copy()
+    affine[:3, 3] = apply_affine(img.affine, [s.start for s in box])
+    return new_img_like(img, get_data(img)[box], affine, copy_header=True)
+
+
 def _viewer_size(shape):
     """Define the size of the viewer.
     Returns: width_view, height_view.
@@ -182,8 +515,12 @@ def _viewer_size(shape):
 
 def _get_cut_slices(stat_map_img, cut_coords=None, threshold=None):
     """For internal use. Find slice numbers for the cut."""
+    from nibabel.affines import apply_affine
+
     # Select coordinates for the cut
     if cut_coords is None:
+        from nilearn.plotting.find_cuts import find_xyz_cut_coords
+
         cut_coords = find_xyz_cut_coords(stat_map_img, activation_threshold=threshold)
 
     # Convert cut coordinates into cut slices
@@ -205,48 +542,486 @@ def _get_cut_slices(stat_map_img, cut_coords=None, threshold=None):
     return cut_slices
 
 
+def _colormap_lut(cmap):
+    """Build the uint8 lookup table of a colormap.
+    Returns: lut (array of shape (N + 3, 4)), with the colors for under,
+    the N colormap entries, over and bad, in that order.
+    """
+    from matplotlib import colormaps
+
+    if isinstance(cmap, str) and cmap not in colormaps:
+        # Register the nilearn colormaps, such as cold_hot, in matplotlib
+        import nilearn.plotting.cm  # noqa: F401
+
+    cmap = colormaps.get_cmap(cmap)
+    lut = np.empty((cmap.N + 3, 4), dtype=np.uint8)
+    lut[1:-2] = cmap(np.arange(cmap.N), bytes=True)
+    extremes = np.array([cmap.get_under(), cmap.get_over(), cmap.get_bad()])
+    lut[[0, -2, -1]] = (extremes * 255).astype(np.uint8)
+    return lut
+
+
+def _normalize_data(data, vmin=None, vmax=None, mask=None):
+    """Rescale data linearly, so that vmin maps to 0 and vmax to 1.
+    Returns: values (float64 array).
+    The rescaled values are computed in float64 whatever the dtype of data,
+    as matplotlib.colors.Normalize does on the float64 sprites of previous
+    versions, so that boundary values fall in the same colormap entries.
+    If vmin or vmax is None, the min or max of the unmasked data is used.
+    """
+    values = np.array(data, dtype=np.float64)
+    valid = data if mask is None else np.ma.array(data, mask=mask)
+    vmin = np.float64(valid.min() if vmin is None else vmin)
+    vmax = np.float64(valid.max() if vmax is None else vmax)
+    if vmin > vmax:
+        raise ValueError("minvalue must be less than or equal to maxvalue")
+    if vmin == vmax:
+        values.fill(0)
+    else:
+        values -= vmin
+        values /= vmax - vmin
+    return values
+
+
+def _data_to_lut_indices(data, vmin, vmax, cmap, mask=None):
+    """Quantize a 2D array into the lookup table of a colormap.
+    Returns: ind (array of indices in lut), lut (see _colormap_lut).
+    The values are quantized exactly as matplotlib.colors.Colormap would do,
+    so that the colors match the output of matplotlib.image.imsave.
+    Masked pixels (mask True) get the "bad" color of the colormap, which is
+    transparent by default.
+    """
+    lut = _colormap_lut(cmap)
+    return _lut_indices(data, vmin, vmax, lut, mask=mask), lut
+
+
+def _lut_indices(data, vmin, vmax, lut, mask=None):
+    """Quantize a 2D array into a colormap lookup table, see _data_to_lut_indices.
+    Returns: ind (array of indices in lut).
+    """
+    n_colors = lut.shape[0] - 3
+    values = _normalize_data(data, vmin=vmin, vmax=vmax, mask=mask)
+
+    bad = np.isnan(values)
+    if mask is not None:
+        bad |= mask.astype(bool, copy=False)
+    values *= n_colors
+    values[values == n_colors] = n_colors - 1
+    np.floor(values, out=values)
+    np.clip(values, -1, n_colors, out=values)
+    values += 1
+    with np.errstate(invalid="ignore"):
+        ind = values.astype(np.min_scalar_type(n_colors + 2))
+    ind[bad] = n_colors + 2
+
+    return ind
+
+
+def _data_to_rgba(data, vmin, vmax, cmap, mask=None):
+    """Map a 2D array to uint8 RGBA colors through a colormap lookup table.
+    Returns: rgba (uint8 array of shape data.shape + (4,)).
+    """
+    ind, lut = _data_to_lut_indices(data, vmin, vmax, cmap, mask=mask)
+    return lut.take(ind, axis=0)
+
+
+def _lut_to_palette(ind, lut):
+    """Reduce an image indexed in a lookup table to the colors it uses.
+    Returns: ind (uint8 array), palette (uint8 array of shape (n, 4)),
+    or None if the image uses more than 256 distinct colors.
+    """
+    colors, inverse = np.unique(lut, axis=0, return_inverse=True)
+    used = np.zeros(lut.shape[0], dtype=bool)
+    used[ind] = True
+    used_colors = np.unique(inverse[used])
+    if used_colors.size > _PNG_PALETTE_SIZE:
+        return None
+    remap = np.zeros(colors.shape[0], dtype=np.uint8)
+    remap[used_colors] = np.arange(used_colors.size)
+    return remap[inverse].take(ind), colors[used_colors]
+
+
+def _png_chunk(tag, data):
+    """Build a PNG chunk, with its length and CRC."""
+    return (
+        struct.pack(">I", len(data))
+        + tag
+        + data
+        + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+    )
+
+
+def _png_palette_chunks(palette):
+    """Build the PLTE chunk of a palette of RGBA colors, and its tRNS chunk
+    if some of the colors are transparent.
+    """
+    chunks = [_png_chunk(b"PLTE", palette[:, :3].tobytes())]
+    transparent = np.flatnonzero(palette[:, 3] < _OPAQUE)
+    if transparent.size:
+        chunks.append(_png_chunk(b"tRNS", palette[: transparent[-1] + 1, 3].tobytes()))
+    return chunks
+
+
+def _write_png(handle, pixels, palette=None, compression_level=None):
+    """Write an 8-bit grayscale, palette or RGBA image in PNG format with zlib.
+    pixels is a uint8 array: 2D for grayscale (or palette indices, if a
+    palette of RGBA colors is specified), 3D with 4 channels for RGBA.
+    """
+    height, width = pixels.shape[:2]
+    if compression_level is None:
+        compression_level = -1
+    color_type = {2: _PNG_GRAY, 3: _PNG_RGBA}[pixels.ndim]
+    if palette is not None:
+        color_type = _PNG_PALETTE
+
+    # Each row of pixels starts with a filter type byte. The "Up" filter
+    # helps compressing grayscale images, other images are left as is.
+    raw = np.empty((height, 1 + pixels[0].size), dtype=np.uint8)
+    raw[:, 1:] = pixels.reshape(height, -1)
+    raw[:, 0] = 2 if color_type == _PNG_GRAY else 0
+    if color_type == _PNG_GRAY:
+        raw[1:, 1:] -= raw[:-1, 1:].copy()
+
+    header = struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)
+    chunks = [_png_chunk(b"IHDR", header)]
+    if color_type == _PNG_PALETTE:
+        chunks.extend(_png_palette_chunks(palette))
+    chunks.append(_png_chunk(b"IDAT", zlib.compress(raw.tobytes(), compression_level)))
+    chunks.append(_png_chunk(b"IEND", b""))
+
+    handle.write(b"\x89PNG\r\n\x1a\n")
+    handle.writelines(chunks)
+
+
+def _indexed_to_pixels(ind, lut):
+    """Pick the most compact PNG representation of an indexed image.
+    Returns: pixels, palette.
+    pixels is 2D uint8 for grayscale images (palette is None) and palette
+    images, and 3D uint8 RGBA (palette is None) if the image has too many
+    colors for a palette.
+    """
+    indexed = _lut_to_palette(ind, lut)
+    if indexed is None:
+        return lut.take(ind, axis=0), None
+    pixels, palette = indexed
+    if (palette[:, 3] == _OPAQUE).all() and (palette[:, :3] == palette[:, :1]).all():
+        return palette[:, 0].take(pixels), None
+    return pixels, palette
+
+
+def _save_png(handle, ind, lut, png_backend="matplotlib", compression_level=None, format="png"):
+    """Encode an image indexed in a colormap lookup table.
+    The matplotlib backend always writes RGBA images. The zlib and pillow
+    backends write 8-bit grayscale or palette images, whenever the image
+    uses few enough colors.
+    """
+    if png_backend == "matplotlib" or format != "png":
+        from matplotlib.image import imsave
+
+        pil_kwargs = None if compression_level is None else {"compress_level": compression_level}
+        imsave(handle, lut.take(ind, axis=0), format=format, pil_kwargs=pil_kwargs)
+        return
+    if png_backend not in ("zlib", "pillow"):
+        raise ValueError(
+            "png_backend should be one of 'matplotlib', 'zlib' or 'pillow'. "
+            f"You provided png_backend={png_backend}"
+        )
+
+    pixels, palette = _indexed_to_pixels(ind, lut)
+    if png_backend == "zlib":
+        _write_png(handle, pixels, palette=palette, compression_level=compression_level)
+        return
+
+    try:
+        from PIL import Image
+    except ImportError as e:
+        raise ImportError("png_backend='pillow' requires the Pillow package.") from e
+    image = Image.fromarray(pixels)
+    save_kwargs = {} if compression_level is None else {"compress_level": compression_level}
+    if palette is not None:
+        image.putpalette(palette[:, :3].tobytes())
+        save_kwargs["transparency"] = palette[:, 3].tobytes()
+    image.save(handle, format="png", **save_kwargs)
+
+
+def _slab_data(img):
+    """Get the array the slabs of a 3D image are read from. Uncompressed
+    image files are read through their array proxy, one slab at a time.
+    Compressed files cannot be read at random: each slab would decompress
+    the file again, so they are loaded in a single pass, as are file objects.
+    Returns: data (array or array proxy).
+    """
+    from nibabel.openers import ImageOpener
+    from nilearn.image import get_data
+
+    if img.in_memory:
+        return img.dataobj
+    file_like = getattr(img.dataobj, "file_like", None)
+    if isinstance(file_like, (str, Path)) and (
+        Path(file_like).suffix.lower() not in ImageOpener.compress_ext_map
+    ):
+        return img.dataobj
+    return get_data(img)
+
+
+def _sprite_slabs(img, radiological=False):
+    """Read the sagittal slices of a 3D image by slabs, one row of tiles of
+    its sprite at a time (see _data_to_sprite). Uncompressed image files are
+    read through their array proxy, so that only one slab is loaded at a
+    time, see _slab_data. Non-finite values are replaced by zeros.
+    Returns: generator of rows of tiles (2D arrays of shape (nz, ncolumns * ny)).
+    """
+    data = _slab_data(img)
+    nx, ny, nz = img.shape[:3]
+    nrows, ncolumns = _sprite_grid(nx)
+    warned = False
+    for row in range(nrows):
+        start, stop = min(row * ncolumns, nx), min((row + 1) * ncolumns, nx)
+        if radiological:
+            slab = np.asanyarray(data[nx - stop : nx - start])[::-1]
+        else:
+            slab = np.asanyarray(data[start:stop])
+
+        # The last rows of tiles are completed with empty slices
+        tiles = np.zeros((nz, ncolumns, ny), dtype=slab.dtype)
+        tiles[:, : stop - start] = slab[:, :, ::-1].transpose(2, 0, 1)
+        finite = np.isfinite(tiles)
+        if not finite.all():
+            if not warned:
+                warnings.warn(
+                    "Non-finite values detected. These values will be replaced with zeros.",
+                    stacklevel=2,
+                )
+                warned = True
+            tiles[~finite] = 0
+        yield tiles.reshape(nz, ncolumns * ny)
+
+
+def _sprite_lut_indices(img, vmin, vmax, lut, mask=None, radiological=False):
+    """Quantize the sprite of a 3D image into a colormap lookup table, one
+    row of tiles at a time, see _sprite_slabs. Peak memory is bounded by a
+    slab of the image and the indexed sprite, rather than several full size
+    float copies of the image.
+    Returns: ind (array of indices in lut).
+    """
+    nx, ny, nz = img.shape[:3]
+    nrows, ncolumns = _sprite_grid(nx)
+    ind = np.empty((nrows * nz, ncolumns * ny), dtype=np.min_scalar_type(lut.shape[0] - 1))
+    masks = _sprite_slabs(mask, radiological) if mask is not None else [None] * nrows
+    for row, (slab, mask_slab) in enumerate(
+        zip(_sprite_slabs(img, radiological), masks, strict=True)
+    ):
+        ind[row * nz : (row + 1) * nz] = _lut_indices(slab, vmin, vmax, lut, mask=mask_slab)
+    return ind
+
+
 def _save_sprite(
-    img, vmax, vmin, output_sprite=None, mask=None, cmap="Grays", format="png", radiological=False
+    img,
+    vmax,
+    vmin,
+    output_sprite=None,
+    mask=None,
+    cmap="Grays",
+    format="png",
+    radiological=False,
+    png_backend="matplotlib",
+    compression_level=None,
 ):
-    """Generate a sprite from a 3D Niimg-like object.
+    """Generate a sprite from a 3D Niimg-like object. With both vmin and
+    vmax, images are colormapped one slab at a time, see _sprite_slabs.
+    The viewers do not benefit from it when fitted: their stat map is
+    resampled, and their background loaded by _load_bg_img, in memory.
     Returns: sprite.
     """
-    # Create sprite
-    sprite = _data_to_sprite(safe_get_data(img, ensure_finite=True), radiological)
+    if vmin is not None and vmax is not None:
+        # Apply the colormap to the sprite, one slab of the image at a time
+        lut = _colormap_lut(cmap)
+        ind = _sprite_lut_indices(img, vmin, vmax, lut, mask=mask, radiological=radiological)
+    else:
+        from nilearn._utils.niimg import safe_get_data
 
-    # Mask the sprite
-    if mask is not None:
-        mask = _data_to_sprite(safe_get_data(mask, ensure_finite=True), radiological)
-        sprite = np.ma.array(sprite, mask=mask)
+        # The range of the colormap depends on the whole sprite
+        sprite = _data_to_sprite(safe_get_data(img, ensure_finite=True), radiological)
+        if mask is not None:
+            mask = _data_to_sprite(safe_get_data(mask, ensure_finite=True), radiological)
+        ind, lut = _data_to_lut_indices(sprite, vmin=vmin, vmax=vmax, cmap=cmap, mask=mask)
 
     # Save the sprite
     if output_sprite is None:
         output_sprite = BytesIO()
-        imsave(output_sprite, sprite, vmin=vmin, vmax=vmax, cmap=cmap, format=format)
+        _save_png(output_sprite, ind, lut, png_backend, compression_level, format=format)
         output_sprite = _bytes_io_to_base64(output_sprite)
     else:
-        imsave(output_cmap, data, cmap=cmap, format=format)
+        _save_png(output_sprite, ind, lut, png_backend, compression_level, format=format)
 
     return output_sprite
 
 
-def _save_cm(cmap, output_cmap=None, format="png", n_colors=256):
+def _save_cm(
+    cmap,
+    output_cmap=None,
+    format="png",
+    n_colors=256,
+    png_backend="matplotlib",
+    compression_level=None,
+):
     """Save the colormap of an image as an image file."""
     # the colormap
     data = np.arange(0.0, n_colors) / (n_colors - 1.0)
-    data = data.reshape([1, n_colors])
+    ind, lut = _data_to_lut_indices(data.reshape([1, n_colors]), vmin=0, vmax=1, cmap=cmap)
 
     if output_cmap is None:
         output_cmap = BytesIO()
-        imsave(output_cmap, data, cmap=cmap, format=format)
+        _save_png(output_cmap, ind, lut, png_backend, compression_level, format=format)
         output_cmap = _bytes_io_to_base64(output_cmap)
     else:
-        imsave(output_cmap, data, cmap=cmap, format=format)
+        _save_png(output_cmap, ind, lut, png_backend, compression_level, format=format)
     return output_cmap
 
 
-class StatMapView(HTMLDocument):
-    pass
+def _quantize_values(data, mask, value_channel="uint8"):
+    """Quantize the values of a data array outside of a mask, on 8 or 16 bits.
+    Returns: quantized (uint16 array, zero in the mask), offset, scale.
+    The values are recovered as offset + quantized * scale.
+    """
+    if value_channel not in _VALUE_LEVELS:
+        raise ValueError(
+            "value_channel should be None, 'uint8' or 'uint16'. "
+            f"You provided value_channel={value_channel}"
+        )
+    valid = np.logical_not(mask)
+    values = data[valid]
+    offset, scale = 0.0, 1.0
+    if values.size:
+        offset = float(values.min())
+        span = float(values.max()) - offset
+        if span > 0:
+            scale = span / _VALUE_LEVELS[value_channel]
+    quantized = np.zeros(data.shape, dtype=np.uint16)
+    quantized[valid] = np.rint((values - offset) / scale)
+    return quantized, offset, scale
+
+
+def _save_value_sprite(
+    img, mask, value_channel="uint8", radiological=False, compression_level=None
+):
+    """Generate a sprite of the quantized values of a 3D Niimg-like object.
+    The high and low bytes of the values are stored in the red and green
+    channels of an RGBA png, and the masked voxels are transparent.
+    Returns: sprite (png bytes), offset, scale.
+    """
+    from nilearn._utils.niimg import safe_get_data
+
+    data = safe_get_data(img, ensure_finite=True)
+    mask = safe_get_data(mask, ensure_finite=True).astype(bool)
+    quantized, offset, scale = _quantize_values(data, mask, value_channel)
+
+    quantized = _data_to_sprite(quantized, radiological)
+    pixels = np.zeros((*quantized.shape, 4), dtype=np.uint8)
+    pixels[..., 0] = quantized >> 8
+    pixels[..., 1] = quantized & 0xFF
+    # The empty slices completing the sprite are transparent as well
+    pixels[..., 3] = _OPAQUE * _data_to_sprite(np.logical_not(mask), radiological)
+
+    output = BytesIO()
+    _write_png(output, pixels, compression_level=compression_level)
+    return output.getvalue(), offset, scale
+
+
+def clear_cache():
+    """Clear the MNI152 backgrounds memoized in the process.
+
+    When the MNI152 template is used as a background, the template image and
+    its sprite are prepared once per combination of parameters (dim, black_bg,
+    radiological, ...), and reused by all viewers in the process.
+    """
+    with _BACKGROUND_MEMO_LOCK:
+        _BACKGROUND_MEMO.clear()
+
+
+@functools.cache
+def _stat_map_view():
+    """Define the StatMapView class, a nilearn HTMLDocument.
+    Returns: StatMapView.
+    """
+    from nilearn._utils.html_document import HTMLDocument
+
+    class StatMapView(HTMLDocument):
+        pass
+
+    StatMapView.__module__ = __name__
+    StatMapView.__qualname__ = "StatMapView"
+    return StatMapView
+
+
+def __getattr__(name):
+    """Define StatMapView on first access, without importing nilearn upfront."""
+    if name == "StatMapView":
+        return _stat_map_view()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _timed(func, *args, **kwargs):
+    """Call a function, and measure its wall time.
+    Returns: output, wall time (s).
+    """
+    start = time.perf_counter()
+    output = func(*args, **kwargs)
+    return output, time.perf_counter() - start
+
+
+def _nbytes(output):
+    """Measure the arrays and the encoded data (png, html, js) in the output of a stage.
+    Returns: array_bytes, output_bytes.
+    """
+    array_bytes, output_bytes = 0, 0
+    if isinstance(output, (bytes, str)):
+        output_bytes = len(output)
+    elif isinstance(output, np.ndarray):
+        array_bytes = output.nbytes
+    elif hasattr(output, "dataobj"):
+        # Images loaded from a file hold a proxy, not an array
+        array_bytes = getattr(output.dataobj, "nbytes", 0)
+    elif isinstance(output, (dict, tuple, list)):
+        for item in output.values() if isinstance(output, dict) else output:
+            sizes = _nbytes(item)
+            array_bytes += sizes[0]
+            output_bytes += sizes[1]
+    return array_bytes, output_bytes
+
+
+def _run_stages(parallel, stages, cache=None, keys=None, timings=None):
+    """Run independent stages in parallel, skipping the ones found in the cache.
+    stages is a dictionary of joblib delayed calls, and keys a dictionary
+    of cache keys, both indexed by stage name. The wall time of the stages
+    which ran is stored in the timings dictionary, if specified.
+    Returns: a dictionary of outputs, indexed by stage name.
+    """
+    outputs = {}
+    if cache is not None:
+        for name in stages:
+            value = cache.get(keys[name])
+            if value is not None:
+                outputs[name] = value
+    names = [name for name in stages if name not in outputs]
+    calls = (
+        delayed(_timed)(func, *args, **kwargs) for func, args, kwargs in map(stages.get, names)
+    )
+    for name, (value, elapsed) in zip(names, parallel(calls), strict=True):
+        outputs[name] = value
+        if timings is not None:
+            timings[name] = elapsed
+        if cache is not None:
+            cache.put(keys[name], value)
+    return outputs
+
+
+def _fit_viewer(viewer, stat_map_img, bg_img, background):
+    """Fit a viewer with a prepared background, in a single process.
+    Returns: viewer.
+    """
+    viewer._fit(stat_map_img, bg_img, background, n_jobs=1)
+    return viewer
 
 
 class viewer_substitute:
@@ -287,7 +1062,7 @@ class viewer_substitute:
         is white or black.
     :type black_bg: boolean, optional
     :param cmap: The colormap for specified image.
-    :type cmap:  matplotlib colormap, optional
+    :type cmap:  matplotlib colormap or str, optional
     :param symmetric_cmap: True: make colormap symmetric (ranging from -vmax to vmax).
         False: the colormap will go from the minimum of the volume to vmax.
         Set it to False if you are plotting a positive volume, e.g. an atlas
@@ -320,17 +1095,94 @@ class viewer_substitute:
     :param value: display the value of the overlay at the current voxel.
     :type value: boolean, optional
     :param base64: turn on/off embedding of sprites in the html using base64 encoding.
-        If the flag is off, the sprites (and the colorbar) will be saved in
-        files named based on parameters sprite, sprite_overlay and img_colorMap.
+        If the flag is off, the sprites (and the colorbar) will be saved in png
+        files in output_dir, named based on parameters sprite, sprite_overlay and
+        img_colorMap and on a hash of their content, and the html refers to
+        these files. Viewers with the same background share the same file.
     :type base64: boolean (default True)
     :type radiological: boolean (default False)
     :type showLR: boolean (default True)
+    :param png_backend: the encoder used for the sprites and colormap png images.
+        'matplotlib' writes RGBA images with matplotlib.image.imsave.
+        'zlib' and 'pillow' write 8-bit grayscale or palette images whenever
+        possible, which is faster and yields smaller images, using a built-in
+        zlib encoder or the Pillow library, respectively.
+    :type png_backend: str (default 'matplotlib')
+    :param compression_level: the zlib compression level of the png images,
+        from 0 (no compression, fastest) to 9 (smallest images).
+        If None, the default level of the backend is used.
+    :type compression_level: int or None (default None)
+    :param n_jobs: The number of processes used to run independent stages of fit
+        (resampling, sprite generation, ...), or to fit viewers in fit_many.
+        -1 means all CPUs. The results do not depend on n_jobs.
+    :type n_jobs: int (default 1)
+    :param cache_dir: A directory where the resampled stat map, cut slices and
+        sprites are cached, indexed by a hash of the input images and parameters.
+        When fit is called again on the same inputs, these stages are skipped.
+        The hits and misses of the cache during the last fit are reported in
+        the cache_info_ attribute. If None, nothing is cached.
+    :type cache_dir: str, pathlib.Path or None (default None)
+    :param cache_size: The maximal size of the cache, in bytes. The least recently
+        used entries are evicted first. If None, the size of the cache is not limited.
+    :type cache_size: int or None (default None)
+    :param mask_resampling: How the thresholded voxels are found in the resampled
+        stat map. 'nearest' resamples the mask of the stat map with nearest
+        neighbour interpolation. 'threshold' applies the threshold again to the
+        resampled stat map, which skips the resampling of the mask and masks out
+        the interpolated values below the threshold.
+    :type mask_resampling: str (default 'nearest')
+    :param crop: If 'auto', the sprites only cover the bounding box of the
+        nonzero voxels of the background and of the thresholded stat map,
+        which makes the viewer smaller. If None, the sprites cover the
+        whole background image.
+    :type crop: str or None (default None)
+    :param output_dir: The directory where the png files are saved when base64 is off,
+        and the library when library_mode is 'file'.
+        If None, the files are saved in the current directory.
+    :type output_dir: str, pathlib.Path or None (default None)
+    :param assets_url: The url of output_dir, as seen from the html report, used
+        to refer to the files saved in output_dir. If None, the path of
+        output_dir is used, which should then be relative to the html report.
+    :type assets_url: str or None (default None)
+    :param library_mode: How the brainsprite.js library is substituted by transform.
+        'inline' inlines the whole library in each report. 'file' saves the library
+        once in output_dir, and only inlines a snippet which loads it, so that
+        all reports share the same file. The library should then be substituted
+        inside a <script> block of the page, before the script creating the viewer.
+        The library is loaded synchronously while the page is parsed. If the
+        snippet is inserted once the page is loaded, the library loads
+        asynchronously, and the viewer should only be created on its load event.
+    :type library_mode: str (default 'inline')
+    :param value_channel: If 'uint8' or 'uint16', the values of the resampled stat
+        map are quantized on 8 or 16 bits and embedded as an extra sprite, from
+        which the viewer reads the value at the current voxel. If None, the
+        value is recovered from the color of the overlay, on 256 levels.
+    :type value_channel: str or None (default None)
+    :param dtype: The dtype of the data through masking, resampling and sprite
+        generation. With 'auto', the stat map is loaded as float32 (int32 for
+        integer data), as nilearn does, and the spline coefficients of the
+        continuous resampling are float64. With 'float32', the stat map, the
+        background and the spline coefficients are all float32, which halves the
+        memory and bandwidth of the stages for float64 images, at the cost of
+        float32 rounding in the resampled values. With 'preserve', the stat map
+        is kept in its own dtype.
+    :type dtype: str (default 'auto')
+    :param profile_hook: A function called as profile_hook(stage, record) after each
+        stage of fit, to forward the record of the stage to a metrics system.
+        Whether or not a hook is set, fit stores the records of all stages in the
+        profile_ attribute, and their wall times in timings_. A record is a
+        dictionary with the wall time in s ("time"), the size of the arrays
+        ("array_bytes") and of the encoded data ("output_bytes") in the output of
+        the stage, and whether the output was found in the cache ("cached").
+        fit_many calls the hook in the calling process, with the records of each
+        viewer once it is fitted, rather than in the worker processes.
+    :type profile_hook: callable or None (default None)
 
     :return bsprite: a brainsprite viewer template substitution tool.
 
     """
 
-    def __init__(
+    def __init__(  # noqa: PLR0913, PLR0915, PLR0917
         self,
         canvas="3Dviewer",
         sprite="spriteImg",
@@ -343,7 +1195,7 @@ class viewer_substitute:
         annotate=True,
         draw_cross=True,
         black_bg="auto",
-        cmap=cm.cold_hot,
+        cmap="cold_hot",
         symmetric_cmap=True,
         dim="auto",
         vmax=None,
@@ -354,6 +1206,19 @@ class viewer_substitute:
         base64=True,
         radiological=False,
         showLR=True,
+        png_backend="matplotlib",
+        compression_level=None,
+        n_jobs=1,
+        cache_dir=None,
+        cache_size=None,
+        mask_resampling="nearest",
+        crop=None,
+        output_dir=None,
+        assets_url=None,
+        library_mode="inline",
+        value_channel=None,
+        dtype="auto",
+        profile_hook=None,
     ):
         """Set up default attributes for the class."""
         self.canvas = canvas
@@ -378,6 +1243,19 @@ class viewer_substitute:
         self.base64 = base64
         self.radiological = radiological
         self.showLR = showLR
+        self.png_backend = png_backend
+        self.compression_level = compression_level
+        self.n_jobs = n_jobs
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        self.mask_resampling = mask_resampling
+        self.crop = crop
+        self.output_dir = output_dir
+        self.assets_url = assets_url
+        self.library_mode = library_mode
+        self.value_channel = value_channel
+        self.dtype = dtype
+        self.profile_hook = profile_hook
 
     def fit(self, stat_map_img, bg_img="MNI152"):
         """Generate sprite and meta-data from a brain volume. Also optionally
@@ -393,10 +1271,69 @@ class viewer_substitute:
         :type bg_img: Niimg-like object, optional
             See https://nilearn.github.io/dev/manipulating_images/index.html
         """
+        self._fit(stat_map_img, bg_img)
+
+    def fit_many(self, stat_map_imgs, bg_img="MNI152"):
+        """Generate sprites and meta-data for a series of brain volumes,
+        displayed on top of a shared background image.
+
+        The background image is loaded, resampled and encoded as a sprite
+        only once, and reused for all viewers. Each viewer is identical to
+        the result of calling fit on a copy of this object. The viewers are
+        fitted in parallel over n_jobs processes, and the records of their
+        stages passed to profile_hook as they complete.
+
+        :param stat_map_imgs: The statistical map images. Each one can be either
+            a 3D volume or a 4D volume with exactly one time point.
+        :type stat_map_imgs: iterable of Niimg-like objects, See
+            https://nilearn.github.io/dev/manipulating_images/index.html
+        :param bg_img: The background image that the stat maps will be plotted on top of.
+            If nothing is specified, the MNI152 template will be used.
+            To turn off background image, just pass "bg_img=False".
+        :type bg_img: Niimg-like object, optional
+            See https://nilearn.github.io/dev/manipulating_images/index.html
+
+        :return viewers: one fitted copy of this object per stat map.
+        :rtype: list of viewer_substitute
+        """
+        # Without background image, the empty background depends on the stat map
+        background = None
+        if bg_img is not None and bg_img is not False:
+            background = self._fit_background(None, bg_img, self._cache())
+
+        # In a worker process, the hook would not reach the caller: the records
+        # of the viewers are passed to the hook here instead
+        worker = copy.copy(self)
+        worker.profile_hook = None
+        viewers = Parallel(n_jobs=self.n_jobs, return_as="generator")(
+            delayed(_fit_viewer)(copy.copy(worker), stat_map_img, bg_img, background)
+            for stat_map_img in stat_map_imgs
+        )
+        fitted = []
+        for viewer in viewers:
+            viewer.profile_hook = self.profile_hook
+            viewer._forward_profile()
+            fitted.append(viewer)
+        return fitted
+
+    def _fit(self, stat_map_img, bg_img, background=None, n_jobs=None):
+        """Fit the viewer, using a background prepared by _fit_background if
+        specified. Independent stages run in parallel over n_jobs processes
+        (self.n_jobs by default).
+        """
+        self.profile_ = {}
+        self.timings_ = {}
+
+        from nilearn.plotting._engine_utils import colorscale
+
         # Prepare the color map and thresholding
-        mask_img, stat_map_img, data, self.threshold = _mask_stat_map(stat_map_img, self.threshold)
+        mask_img, stat_map_img, data, self.threshold = self._profiled(
+            "mask", _mask_stat_map, stat_map_img, self.threshold, self.dtype
+        )
 
-        self.colors_ = colorscale(
+        self.colors_ = self._profiled(
+            "colorscale",
+            colorscale,
             self.cmap,
             data.ravel(),
             threshold=self.threshold,
@@ -404,6 +1341,8 @@ class viewer_substitute:
             vmax=self.vmax,
             vmin=self.vmin,
         )
+        # The thresholded data are only needed for the color scale
+        del data
 
         if self.black_bg:
             cfont = "#FFFFFF"
@@ -413,40 +1352,268 @@ class viewer_substitute:
             cbg = "#FFFFFF"
 
         # Prepare the data for the cuts
-        bg_img, self.bg_min_, self.bg_max_, self.black_bg_ = _load_bg_img(
-            stat_map_img, bg_img, self.black_bg, self.dim
-        )
-        stat_map_img, mask_img = _resample_stat_map(
-            stat_map_img, bg_img, mask_img, self.resampling_interpolation
+        cache = self._cache()
+        if background is None:
+            background = self._load_background(stat_map_img, bg_img, cache)
+        bg_img, self.bg_min_, self.bg_max_, self.black_bg_, bg_sprite = background
+
+        # Resample the stat map, find the cuts and generate the sprites.
+        # The html snippet is generated from the sprites when needed
+        stat_map_img = self._fit_stages(
+            stat_map_img,
+            mask_img,
+            bg_img,
+            bg_sprite,
+            self.n_jobs if n_jobs is None else n_jobs,
+            cache,
         )
-        self.cut_slices_ = _get_cut_slices(stat_map_img, self.cut_coords, self.threshold)
-
-        # Now create the viewer, and populate the sprite data
-        self.html_ = self._brainsprite_html(bg_img, stat_map_img, mask_img)
 
         # Add the javascript snippet
-        self.javascript_ = self._brainsprite_js(
+        self.javascript_ = self._profiled(
+            "javascript",
+            self._brainsprite_js,
             shape=stat_map_img.shape,
             affine=stat_map_img.affine,
             colorFont=cfont,
             colorBackground=cbg,
         )
 
-        # Add the brainsprite.min.js library
-        # if the unminified version is present,
-        # we rely on it (useful for testing coverage in javascript)
-        js_dir = Path(__file__).parent / "data" / "js"
-        if (js_dir / "brainsprite.js").exists():
-            with (js_dir / "brainsprite.js").open("r") as f:
-                self.library_ = f.read()
-        else:
-            with (js_dir / "brainsprite.min.js").open("r") as f:
-                self.library_ = f.read()
+        # Add the brainsprite.min.js library, inline or saved in a file
+        self.library_ = self._library_snippet()
 
         # Suggest a size for the viewer
         # width x height, in pixels
         self.width_, self.height_ = _viewer_size(stat_map_img.shape)
 
+    def _fit_stages(self, stat_map_img, mask_img, bg_img, bg_sprite=None, n_jobs=1, cache=None):
+        """Resample the stat map, find the cut slices and generate the sprites.
+        Stages which do not depend on each other run in parallel, and stages
+        found in the cache are skipped. With crop='auto', the background sprite
+        is generated once the bounding box of the resampled stat map is known.
+        Sets sprites_, the png data of the background, overlay and colormap,
+        and of the values with value_channel (see value_quantization_).
+        Returns: stat_map_img (resampled).
+        """
+        keys = self._cache_keys(stat_map_img, bg_img) if cache is not None else {}
+        with Parallel(n_jobs=n_jobs) as parallel:
+            stages = {
+                "resampled": delayed(_resample_stat_map)(
+                    stat_map_img,
+                    bg_img,
+                    mask_img,
+                    self.resampling_interpolation,
+                    self.threshold,
+                    self.mask_resampling,
+                    self.dtype,
+                ),
+                "colormap": delayed(self._colormap_sprite)(),
+            }
+            if bg_sprite is None and self.crop is None:
+                stages["background"] = delayed(self._bg_sprite)(bg_img, self.bg_min_, self.bg_max_)
+            outputs = self._run_stages(parallel, stages, cache, keys)
+            stat_map_img, mask_img = outputs["resampled"]
+
+            if self.crop is not None:
+                bg_img, stat_map_img, mask_img = self._profiled(
+                    "crop", self._crop, bg_img, stat_map_img, mask_img, keys
+                )
+                bg_sprite = None
+            stages = {
+                "overlay": delayed(self._overlay_sprite)(stat_map_img, mask_img),
+                "cuts": delayed(_get_cut_slices)(stat_map_img, self.cut_coords, self.threshold),
+            }
+            if bg_sprite is None and "background" not in outputs:
+                stages["background"] = delayed(self._bg_sprite)(bg_img, self.bg_min_, self.bg_max_)
+            if self.value_channel is not None:
+                stages["values"] = delayed(self._value_sprite)(stat_map_img, mask_img)
+            outputs.update(self._run_stages(parallel, stages, cache, keys))
+
+        self.cut_slices_ = outputs["cuts"]
+        self.cache_info_ = {
+            "hits": 0 if cache is None else cache.hits,
+            "misses": 0 if cache is None else cache.misses,
+        }
+        self._set_sprites(outputs, bg_sprite)
+        if not self.base64:
+            self._profiled("assets", self._write_assets)
+        return stat_map_img
+
+    def _load_background(self, stat_map_img, bg_img, cache=None):
+        """Load the background image. The sprite of the MNI152 template is
+        generated as well, and its lookup in the cache counts in cache_info_.
+        Returns: bg_img, bg_min, bg_max, black_bg, bg_sprite (or None).
+        """
+        if not (isinstance(bg_img, str) and bg_img == "MNI152"):
+            background = self._profiled(
+                "load_background",
+                _load_bg_img,
+                stat_map_img,
+                bg_img,
+                self.black_bg,
+                self.dim,
+                self.dtype,
+            )
+            return (*background, None)
+
+        hits = 0 if cache is None else cache.hits
+        background, elapsed = _timed(self._fit_background, stat_map_img, bg_img, cache)
+        cached = cache is not None and cache.hits > hits
+        self._record("load_background", elapsed, background, cached=cached)
+        return background
+
+    def _set_sprites(self, outputs, bg_sprite=None):
+        """Collect the sprites generated by the stages of fit.
+        Sets sprites_, and value_quantization_ (the offset and scale of the
+        quantized values, or None without value_channel).
+        """
+        self.sprites_ = (
+            outputs.get("background", bg_sprite),
+            outputs["overlay"],
+            outputs["colormap"],
+        )
+        self.value_quantization_ = None
+        if self.value_channel is not None:
+            values, offset, scale = outputs["values"]
+            self.sprites_ = (*self.sprites_, values)
+            self.value_quantization_ = {"offset": offset, "scale": scale}
+
+    def _record(self, stage, elapsed, output=None, cached=None):
+        """Record the wall time of a stage of fit (None if it was found in the
+        cache) and the size of its output in profile_ and timings_, and pass
+        the record to profile_hook. cached overrides whether the output was
+        found in the cache, for stages which are only partly cached.
+        """
+        array_bytes, output_bytes = _nbytes(output)
+        record = {
+            "time": 0.0 if elapsed is None else elapsed,
+            "array_bytes": array_bytes,
+            "output_bytes": output_bytes,
+            "cached": elapsed is None if cached is None else cached,
+        }
+        self.profile_[stage] = record
+        self.timings_[stage] = record["time"]
+        if self.profile_hook is not None:
+            self.profile_hook(stage, record)
+
+    def _forward_profile(self):
+        """Pass the records of profile_ to profile_hook, in the order of the stages."""
+        if self.profile_hook is not None:
+            for stage, record in self.profile_.items():
+                self.profile_hook(stage, record)
+
+    def _run_stages(self, parallel, stages, cache=None, keys=None):
+        """Run stages of fit with _run_stages, and record them with _record.
+        Returns: a dictionary of outputs, indexed by stage name.
+        """
+        timings = {}
+        outputs = _run_stages(parallel, stages, cache, keys, timings)
+        for name, output in outputs.items():
+            self._record(name, timings.get(name), output)
+        return outputs
+
+    def _profiled(self, stage, func, *args, **kwargs):
+        """Run a stage of fit, and record it with _record.
+        Returns: the output of func.
+        """
+        output, elapsed = _timed(func, *args, **kwargs)
+        self._record(stage, elapsed, output)
+        return output
+
+    def _crop(self, bg_img, stat_map_img, mask_img, keys):
+        """Crop the background, stat map and mask to their bounding box, and
+        update the cache key of the background sprite accordingly.
+        Returns: bg_img, stat_map_img, mask_img.
+        """
+        if self.crop != "auto":
+            raise ValueError(f"crop should be None or 'auto'. You provided crop={self.crop}")
+        box = _bounding_box(bg_img, stat_map_img, mask_img)
+        if box is not None:
+            bg_img, stat_map_img, mask_img = (
+                _crop_img(img, box) for img in (bg_img, stat_map_img, mask_img)
+            )
+        if keys:
+            keys["background"] = self._bg_sprite_key(bg_img, self.bg_min_, self.bg_max_)
+        return bg_img, stat_map_img, mask_img
+
+    def _cache(self):
+        """Open the cache of the viewer.
+        Returns: a _DiskCache, or None if caching is off.
+        """
+        if self.cache_dir is None:
+            return None
+        return _DiskCache(self.cache_dir, self.cache_size)
+
+    def _cache_keys(self, stat_map_img, bg_img):
+        """Hash the inputs and parameters of each stage of fit.
+        Returns: a dictionary of cache keys, indexed by stage.
+        """
+        from nilearn.image import get_data
+
+        png = (self.radiological, self.png_backend, self.compression_level)
+        resampled = _hash(
+            "resampled",
+            get_data(stat_map_img),
+            stat_map_img.affine,
+            self.threshold,
+            self.resampling_interpolation,
+            self.mask_resampling,
+            self.dtype,
+            get_data(bg_img),
+            bg_img.affine,
+        )
+        return {
+            "resampled": resampled,
+            "cuts": _hash("cuts", resampled, self.cut_coords, self.threshold, self.crop),
+            "background": self._bg_sprite_key(bg_img, self.bg_min_, self.bg_max_),
+            "overlay": _hash(
+                "overlay",
+                resampled,
+                self.crop,
+                _colormap_lut(self.cmap),
+                self.colors_["vmin"],
+                self.colors_["vmax"],
+                *png,
+            ),
+            "colormap": _hash(
+                "colormap",
+                _colormap_lut(self.colors_["cmap"]),
+                self.png_backend,
+                self.compression_level,
+            ),
+            "values": _hash(
+                "values",
+                resampled,
+                self.crop,
+                self.value_channel,
+                self.radiological,
+                self.compression_level,
+            ),
+        }
+
+    def _bg_sprite_key(self, bg_img, bg_min, bg_max):
+        """Hash the inputs and parameters of the background sprite."""
+        from nilearn.image import get_data
+
+        return _hash(
+            "background",
+            get_data(bg_img),
+            bg_img.affine,
+            bg_min,
+            bg_max,
+            self.radiological,
+            self.png_backend,
+            self.compression_level,
+        )
+
+    @property
+    def html_(self):
+        """The html snippet of the fitted viewer, with the sprites embedded in base64
+        (or referring to the png files if base64 is off).
+        """
+        handle = StringIO()
+        self._brainsprite_html(handle)
+        return handle.getvalue()
+
     def transform(
         self,
         template,
@@ -500,59 +1667,236 @@ class viewer_substitute:
         # Populate template
         viewer = template.substitute(namespace)
 
-        return StatMapView(viewer, width=width, height=height)
+        return _stat_map_view()(viewer, width=width, height=height)
+
+    def write_html(self, path_or_fileobj, template, javascript, html, library, namespace=None):
+        """Apply substitution in a template, and write the result to a file.
+
+        Unlike transform, the html snippet is never held in memory as a whole:
+        the template is written piece by piece, and the sprites are encoded
+        in base64 chunk by chunk, straight to the file.
+
+        :param path_or_fileobj: the html file to write, or a text file object.
+        :type path_or_fileobj: str, pathlib.Path or file object
+        :param template: a template where brainsprite data needs to be substituted.
+        :type template: tempita template
+        :param javascript: the tempita name to substitute with brainsprite javascript snippet.
+            If None, javascript is not substituted.
+        :type javascript: str or None
+        :param html: the tempita name to substitute with brainsprite html snippet.
+            If None, html is not substituted.
+        :type html: str or None
+        :param library: the tempita name to substitute with the brainsprite js library.
+            If None, library is not substituted.
+        :type library: str or None
+        :param namespace: a list of names to substitute, using tempita's substitute method.
+        :type namespace: dict
+        """
+        namespace = {} if namespace is None else dict(namespace)
+
+        if javascript is not None:
+            namespace[javascript] = self.javascript_
+
+        if library is not None:
+            namespace[library] = self.library_
+
+        parts = _split_template(template, namespace, [] if html is None else [html])
+        if hasattr(path_or_fileobj, "write"):
+            self._write_template(path_or_fileobj, parts)
+        else:
+            with Path(path_or_fileobj).open("w", encoding="utf-8") as handle:
+                self._write_template(handle, parts)
+
+    def _write_template(self, handle, parts):
+        """Write the parts of a template split by _split_template, with the
+        html snippet in place of the streamed name.
+        """
+        for ii, part in enumerate(parts):
+            if ii % 2 == 0:
+                handle.write(part)
+            else:
+                self._brainsprite_html(handle)
+
+    def _fit_background(self, stat_map_img, bg_img, cache=None):
+        """Load the background image and generate its sprite, or read it from
+        the cache of the viewer (see _cache) if specified.
+        The MNI152 template is memoized in the process, see clear_cache.
+        Returns: bg_img, bg_min, bg_max, black_bg, bg_sprite.
+        """
+        if not (isinstance(bg_img, str) and bg_img == "MNI152"):
+            return self._prepare_background(stat_map_img, bg_img, cache)
+
+        key = (
+            bg_img,
+            self.dim,
+            self.black_bg,
+            self.radiological,
+            self.png_backend,
+            self.compression_level,
+            self.crop,
+            self.dtype,
+        )
+        with _BACKGROUND_MEMO_LOCK:
+            if key in _BACKGROUND_MEMO:
+                _BACKGROUND_MEMO.move_to_end(key)
+                return _BACKGROUND_MEMO[key]
+        background = self._prepare_background(stat_map_img, bg_img, cache)
+        with _BACKGROUND_MEMO_LOCK:
+            _BACKGROUND_MEMO[key] = background
+            while len(_BACKGROUND_MEMO) > _BACKGROUND_MEMO_SIZE:
+                _BACKGROUND_MEMO.popitem(last=False)
+        return background
+
+    def _prepare_background(self, stat_map_img, bg_img, cache=None):
+        """Load the background image and generate its sprite, without memoization.
+        With crop, the sprite depends on the stat map and is not generated.
+        Returns: bg_img, bg_min, bg_max, black_bg, bg_sprite.
+        """
+        bg_img, bg_min, bg_max, black_bg = _load_bg_img(
+            stat_map_img, bg_img, self.black_bg, self.dim, self.dtype
+        )
+        if self.crop is not None:
+            return bg_img, bg_min, bg_max, black_bg, None
+        stages = {"background": delayed(self._bg_sprite)(bg_img, bg_min, bg_max)}
+        keys = {"background": self._bg_sprite_key(bg_img, bg_min, bg_max)} if cache else {}
+        bg_sprite = _run_stages(Parallel(n_jobs=1), stages, cache, keys)["background"]
+        return bg_img, bg_min, bg_max, black_bg, bg_sprite
+
+    def _bg_sprite(self, bg_img, bg_min, bg_max):
+        """Generate the sprite of the background image."""
+        output = _save_sprite(
+            output_sprite=BytesIO(),
+            img=bg_img,
+            vmax=bg_max,
+            vmin=bg_min,
+            cmap="gray",
+            radiological=self.radiological,
+            png_backend=self.png_backend,
+            compression_level=self.compression_level,
+        )
+        return _bytes_io_to_bytes(output)
+
+    def _overlay_sprite(self, stat_map_img, mask_img):
+        """Generate the sprite of the (resampled) stat map."""
+        output = _save_sprite(
+            output_sprite=BytesIO(),
+            img=stat_map_img,
+            vmax=self.colors_["vmax"],
+            vmin=self.colors_["vmin"],
+            mask=mask_img,
+            cmap=self.cmap,
+            radiological=self.radiological,
+            png_backend=self.png_backend,
+            compression_level=self.compression_level,
+        )
+        return _bytes_io_to_bytes(output)
+
+    def _value_sprite(self, stat_map_img, mask_img):
+        """Generate the sprite of the quantized values of the (resampled) stat map.
+        Returns: sprite (png bytes), offset, scale.
+        """
+        return _save_value_sprite(
+            stat_map_img,
+            mask_img,
+            self.value_channel,
+            radiological=self.radiological,
+            compression_level=self.compression_level,
+        )
 
-    def _brainsprite_html(self, bg_img, stat_map_img, mask_img):
-        """Create an html snippet for the brainsprite viewer (with sprite data)."""
+    def _colormap_sprite(self):
+        """Generate the image of the colormap."""
+        output = _save_cm(
+            output_cmap=BytesIO(),
+            cmap=self.colors_["cmap"],
+            format="png",
+            png_backend=self.png_backend,
+            compression_level=self.compression_level,
+        )
+        return _bytes_io_to_bytes(output)
+
+    def _output_dir(self):
+        """Find the directory where files are saved, see output_dir."""
+        return Path("." if self.output_dir is None else self.output_dir)
+
+    def _asset_url(self, path):
+        """Refer to a file saved in output_dir from the html report."""
+        if self.assets_url is None:
+            return path.as_posix()
+        return f"{self.assets_url.rstrip('/')}/{path.name}"
+
+    def _sprite_values(self):
+        """Get the label for the html sprite of the values, see value_channel."""
+        return f"{self.sprite_overlay}Values"
+
+    def _write_assets(self):
+        """Save the sprites in output_dir, in files named after their content.
+        Sets assets_, the paths of the background, overlay and colormap files
+        (and values file, with value_channel).
+        """
+        prefixes = [self.sprite, self.sprite_overlay, self.img_colorMap, self._sprite_values()]
+        self.assets_ = [
+            self._output_dir() / _asset_name(prefix, data)
+            for prefix, data in zip(prefixes, self.sprites_, strict=False)
+        ]
+        for path, data in zip(self.assets_, self.sprites_, strict=True):
+            _write_asset(path, data)
+
+    def _library_snippet(self):
+        """Get the brainsprite.js library to substitute in templates. With
+        library_mode='file', the library is saved in output_dir, in a file named
+        after its content and shared by all viewers, and the snippet loads it.
+        Returns: library (js code).
+        """
+        if self.library_mode == "inline":
+            return _library()
+        if self.library_mode != "file":
+            raise ValueError(
+                "library_mode should be 'inline' or 'file'. "
+                f"You provided library_mode={self.library_mode}"
+            )
+        library = _library().encode("utf-8")
+        self.library_file_ = self._output_dir() / _asset_name("brainsprite", library, ".js")
+        _write_asset(self.library_file_, library)
+        return _LIBRARY_LOADER.format(url=self._asset_url(self.library_file_))
+
+    def _brainsprite_html(self, handle):
+        """Write an html snippet for the brainsprite viewer (with sprite data)."""
         # Initiate template
         resource_path = Path(__file__).resolve().parent / "data" / "html"
         if self.base64:
             file_template = resource_path / "brainsprite_template_base64.html"
-            file_bg = None
-            file_overlay = None
-            file_colormap = None
         else:
             file_template = resource_path / "brainsprite_template.html"
-            file_bg = f"{self.sprite}.png"
-            file_bg = f"{self.sprite_overlay}.png"
-            file_colormap = f"{self.img_colorMap}.png"
-        tpl = tempita.Template.from_filename(str(file_template), encoding="utf-8")
-
-        # Fill template
-        snippet_html = tpl.substitute(
-            canvas=self.canvas,
-            sprite=self.sprite,
-            img_colorMap=self.img_colorMap,
-            sprite_overlay=self.sprite_overlay,
-            bg_base64=_save_sprite(
-                output_sprite=file_bg,
-                img=bg_img,
-                vmax=self.bg_max_,
-                vmin=self.bg_min_,
-                cmap="gray",
-                radiological=self.radiological,
-            ),
-            overlay_base64=_save_sprite(
-                output_sprite=file_overlay,
-                img=stat_map_img,
-                vmax=self.colors_["vmax"],
-                vmin=self.colors_["vmin"],
-                mask=mask_img,
-                cmap=self.cmap,
-                radiological=self.radiological,
-            ),
-            colormap_base64=_save_cm(
-                output_cmap=file_colormap, cmap=self.colors_["cmap"], format="png"
-            ),
-        )
-        return snippet_html
+        tpl = _load_template(file_template)
+
+        # Fill template, and stream the sprites
+        namespace = {
+            "canvas": self.canvas,
+            "sprite": self.sprite,
+            "img_colorMap": self.img_colorMap,
+            "sprite_overlay": self.sprite_overlay,
+            "sprite_values": self._sprite_values() if self.value_channel else None,
+        }
+        if not self.base64:
+            names = ["bg_file", "overlay_file", "colormap_file", "values_file"]
+            urls = [self._asset_url(path) for path in self.assets_]
+            namespace.update(zip(names, urls, strict=False))
+            handle.write(tpl.substitute(namespace))
+            return
+        names = ["bg_base64", "overlay_base64", "colormap_base64", "values_base64"]
+        sprites = dict(zip(names, self.sprites_, strict=False))
+        for ii, part in enumerate(_split_template(tpl, namespace, sprites)):
+            if ii % 2 == 0:
+                handle.write(part)
+            else:
+                _write_base64(handle, sprites[part])
 
     def _brainsprite_js(self, shape, affine, colorFont, colorBackground):
         """Create a js snippet for the brainsprite viewer."""
         # Initiate template
         resource_path = Path(__file__).resolve().parent / "data" / "js"
         file_template = resource_path / "brainsprite_template.js"
-        tpl = tempita.Template.from_filename(str(file_template), encoding="utf-8")
+        tpl = _load_template(file_template)
 
         return tpl.substitute(
             canvas=self.canvas,
@@ -581,4 +1925,143 @@ class viewer_substitute:
             colorbar=float(not self.colorbar),
             radiological=float(self.radiological),
             showLR=float(self.showLR),
+            sprite_values=self._sprite_values(),
+            values=self.value_quantization_,
         )
+
+
+def _page_viewers(viewers, bsprite=None, bg_img="MNI152"):
+    """Fit the stat maps in a list of viewers and stat maps, sharing the background.
+    Returns: a list of fitted viewers.
+    """
+    viewers = list(viewers)
+    if not viewers:
+        raise ValueError("viewers must not be empty")
+    stat_maps = [
+        ii for ii, viewer in enumerate(viewers) if not isinstance(viewer, viewer_substitute)
+    ]
+    if stat_maps:
+        bsprite = viewer_substitute() if bsprite is None else bsprite
+        fitted = bsprite.fit_many([viewers[ii] for ii in stat_maps], bg_img=bg_img)
+        for ii, viewer in zip(stat_maps, fitted, strict=True):
+            viewers[ii] = viewer
+    return viewers
+
+
+def _page_entries(viewers):
+    """Namespace the canvases of viewers, and name their images after their
+    content, so that identical sprites (e.g. a shared background) are only
+    written once in a page.
+    Returns: entries (template parameters of each viewer), images (data and
+    url of each image, indexed by id).
+    """
+    images = {}
+    entries = []
+    for ii, viewer in enumerate(viewers):
+        entry = {
+            "canvas": f"{viewer.canvas}-{ii}",
+            "width": viewer.width_,
+            "javascript": viewer.javascript_,
+        }
+        names = ["sprite", "sprite_overlay", "img_colorMap", "sprite_values"]
+        prefixes = [viewer.sprite, viewer.sprite_overlay, viewer.img_colorMap]
+        prefixes.append(viewer._sprite_values())
+        urls = [None] * 4 if viewer.base64 else [viewer._asset_url(path) for path in viewer.assets_]
+        for name, prefix, data, url in zip(names, prefixes, viewer.sprites_, urls, strict=False):
+            entry[name] = _asset_name(prefix, data, suffix="")
+            images[entry[name]] = (data, url)
+        entries.append(entry)
+    return entries, images
+
+
+def _write_images(handle, images):
+    """Write hidden images, to be decoded in the browser by setting their src
+    to data-src. Images without url are embedded in base64.
+    """
+    for image_id, (data, url) in images.items():
+        handle.write(f'<img id="{image_id}" class="hidden" alt="{image_id}" data-src="')
+        if url is None:
+            handle.write("data:image/png;base64,")
+            _write_base64(handle, data)
+        else:
+            handle.write(url)
+        handle.write('">\n')
+
+
+def _write_page(handle, viewers, title=None, lazy=True):
+    """Write an html page featuring a series of fitted viewers."""
+    file_template = Path(__file__).resolve().parent / "data" / "html" / "brainsprite_page.html"
+    tpl = _load_template(file_template)
+    entries, images = _page_entries(viewers)
+
+    # The library is written once, inline or as a file
+    viewer = viewers[0]
+    if viewer.library_mode == "file":
+        library = f'<script src="{viewer._asset_url(viewer.library_file_)}"></script>'
+    else:
+        library = f"<script>\n{_library()}\n</script>"
+
+    namespace = {
+        "title": "brainsprite" if title is None else title,
+        "viewers": entries,
+        "library": library,
+        "lazy": str(bool(lazy)).lower(),
+    }
+    for ii, part in enumerate(_split_template(tpl, namespace, ["images"])):
+        if ii % 2 == 0:
+            handle.write(part)
+        else:
+            _write_images(handle, images)
+
+
+def make_page(viewers, bsprite=None, bg_img="MNI152", title=None, lazy=True):
+    """Build a single html page featuring many brainsprite viewers.
+
+    The canvases of the viewers are namespaced so that their ids do not
+    collide, the brainsprite.js library is included once, and identical
+    sprites (e.g. a shared background) are only embedded once. With lazy,
+    the sprites of a viewer are only decoded by the browser when its canvas
+    scrolls into view, which keeps pages with many viewers responsive.
+
+    :param viewers: fitted viewers, or stat maps (at least one). The stat maps
+        are fitted with bsprite.fit_many, sharing the background image.
+    :type viewers: iterable of viewer_substitute or Niimg-like objects
+    :param bsprite: the viewer used to fit the stat maps.
+        If None, a viewer_substitute with default parameters is used.
+    :type bsprite: viewer_substitute or None
+    :param bg_img: The background image of the stat maps, see viewer_substitute.fit.
+    :type bg_img: Niimg-like object, optional
+    :param title: the title of the html page.
+    :type title: str or None
+    :param lazy: decode the sprites of a viewer only when it scrolls into view,
+        and release its master canvas once it has been offscreen for a while.
+    :type lazy: boolean (default True)
+
+    :return page: the html page.
+    :rtype: StatMapView
+    """
+    viewers = _page_viewers(viewers, bsprite, bg_img)
+    handle = StringIO()
+    _write_page(handle, viewers, title, lazy)
+    return _stat_map_view()(
+        handle.getvalue(),
+        width=max(viewer.width_ for viewer in viewers),
+        height=sum(viewer.height_ for viewer in viewers),
+    )
+
+
+def write_page(path_or_fileobj, viewers, bsprite=None, bg_img="MNI152", title=None, lazy=True):
+    """Write a single html page featuring many brainsprite viewers to a file.
+
+    See make_page. The page is written piece by piece, and the sprites are
+    encoded in base64 chunk by chunk, straight to the file.
+
+    :param path_or_fileobj: the html file to write, or a text file object.
+    :type path_or_fileobj: str, pathlib.Path or file object
+    """
+    viewers = _page_viewers(viewers, bsprite, bg_img)
+    if hasattr(path_or_fileobj, "write"):
+        _write_page(path_or_fileobj, viewers, title, lazy)
+    else:
+        with Path(path_or_fileobj).open("w", encoding="utf-8") as handle:
+            _write_page(handle, viewers, title, lazy)
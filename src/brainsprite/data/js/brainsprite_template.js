@@ -13,7 +13,12 @@
       Y: {{Y_overlay}},
       Z: {{Z_overlay}}
     },
-    opacity: {{opacity}}
+    opacity: {{opacity}}{{if values}},
+    values: {
+      sprite: "{{sprite_values}}",
+      offset: {{values['offset']}},
+      scale: {{values['scale']}}
+    }{{endif}}
   },
   colorBackground: "{{colorBackground}}",
   colorFont: "{{colorFont}}",
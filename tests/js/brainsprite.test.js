@@ -0,0 +1,330 @@
+/* global __BROWSER__ */
+
+const path = require('path')
+
+// Helpers evaluated in the page: build synthetic sprites of a 5 x 4 x 3
+// volume, laid out in a grid of 3 rows and 2 columns of 4 x 3 tiles, as
+// saved by the python library.
+const helpers = `
+window.nbSlice = { X: 5, Y: 4, Z: 3 }
+window.nbCol = 2
+window.nbRow = 3
+
+let seed = 1
+window.random = function () {
+  seed = (seed * 16807) % 2147483647
+  return seed / 2147483647
+}
+
+// Position of a voxel in the sprites
+window.spriteOffset = function (x, y, z) {
+  const posW = x % nbCol
+  const posH = (x - posW) / nbCol
+  return (posH * nbSlice.Z + nbSlice.Z - z - 1) * nbCol * nbSlice.Y + posW * nbSlice.Y + y
+}
+
+// Encode RGBA pixels in a png image, and wait for it to be decoded
+window.pngUrl = function (width, height, pixels) {
+  const canvas = document.createElement('canvas')
+  canvas.width = width
+  canvas.height = height
+  const context = canvas.getContext('2d')
+  const image = context.createImageData(width, height)
+  image.data.set(pixels)
+  context.putImageData(image, 0, 0)
+  return canvas.toDataURL()
+}
+
+window.loadImage = function (img, url) {
+  return new Promise(function (resolve) {
+    img.addEventListener('load', resolve, { once: true })
+    img.src = url
+  })
+}
+
+window.addImage = function (id, width, height, pixels) {
+  const img = document.createElement('img')
+  img.id = id
+  img.className = 'hidden'
+  document.body.appendChild(img)
+  return loadImage(img, pngUrl(width, height, pixels))
+}
+
+// Random opaque pixels, or transparent ones with probability transparent
+window.randomPixels = function (size, transparent) {
+  const pixels = new Uint8ClampedArray(4 * size)
+  for (let ii = 0; ii < size; ii++) {
+    for (let cc = 0; cc < 3; cc++) {
+      pixels[4 * ii + cc] = Math.floor(256 * random())
+    }
+    pixels[4 * ii + 3] = random() < transparent ? 0 : 255
+  }
+  return pixels
+}
+
+// The quantized value of each voxel, encoded in the red and green channels
+window.quantized = function (x, y, z) {
+  return 100 * x + 10 * y + z + 300
+}
+
+window.valuePixels = function () {
+  const pixels = new Uint8ClampedArray(4 * nbCol * nbSlice.Y * nbRow * nbSlice.Z)
+  for (let x = 0; x < nbSlice.X; x++) {
+    for (let y = 0; y < nbSlice.Y; y++) {
+      for (let z = 0; z < nbSlice.Z; z++) {
+        const offset = 4 * spriteOffset(x, y, z)
+        pixels[offset] = quantized(x, y, z) >> 8
+        pixels[offset + 1] = quantized(x, y, z) & 0xFF
+        pixels[offset + 3] = (x + y + z) % 4 === 0 ? 0 : 255
+      }
+    }
+  }
+  return pixels
+}
+
+window.addSprites = function () {
+  const width = nbCol * nbSlice.Y
+  const height = nbRow * nbSlice.Z
+  return Promise.all([
+    addImage('sprite', width, height, randomPixels(width * height, 0)),
+    addImage('overlay', width, height, randomPixels(width * height, 0.5)),
+    addImage('colormap', 8, 1, randomPixels(8, 0))
+  ])
+}
+
+window.viewerParams = function (params) {
+  return Object.assign({
+    canvas: 'canvas',
+    sprite: 'sprite',
+    nbSlice: Object.assign({}, nbSlice),
+    overlay: { sprite: 'overlay', nbSlice: Object.assign({}, nbSlice), opacity: 1 },
+    colorMap: { img: 'colormap', min: -1, max: 1, hide: false },
+    numSlice: { X: 2, Y: 2, Z: 1 },
+    title: 'test'
+  }, params)
+}
+`
+
+describe('brainsprite.js', () => {
+  let page
+
+  beforeEach(async () => {
+    page = await __BROWSER__.newPage()
+    await page.setContent(
+      '<html><head><style>.hidden { display: none; }</style></head><body>' +
+      '<div id="container" style="width: 600px"><canvas id="canvas"></canvas></div>' +
+      '</body></html>')
+    await page.addScriptTag({ path: path.join(__dirname, '..', '..', 'src', 'brainsprite.js') })
+    await page.addScriptTag({ content: helpers })
+  }, 5000)
+
+  afterEach(async () => {
+    await page.close()
+  })
+
+  it('slices the volume as the drawImage fallback', async () => {
+    const result = await page.evaluate(async () => {
+      await addSprites()
+      const brain = brainsprite(viewerParams())
+
+      // Draw all slices of each plane, and read the pixels of the planes
+      const slices = function () {
+        const pixels = []
+        for (const type of ['X', 'Y', 'Z']) {
+          const canvas = brain.planes['canvas' + type]
+          for (let ss = 0; ss < brain.nbSlice[type]; ss++) {
+            brain.numSlice[type] = ss
+            brain.draw(ss, type)
+            pixels.push(Array.from(brain.planes['context' + type].getImageData(
+              0, 0, canvas.width, canvas.height).data))
+          }
+        }
+        return pixels
+      }
+      const volume = brain.planes.volume !== null
+      const sliced = slices()
+
+      // Fall back on drawImage, as when the master canvas is tainted
+      brain.planes.contextMaster.getImageData = function () {
+        throw new Error('tainted')
+      }
+      brain.release()
+      brain.compose()
+      return { volume, fallback: brain.planes.volume === null, sliced, drawn: slices() }
+    })
+    expect(result.volume).toBe(true)
+    expect(result.fallback).toBe(true)
+    expect(result.sliced).toEqual(result.drawn)
+  })
+
+  it('reads values once the sprites are decoded', async () => {
+    const result = await page.evaluate(async () => {
+      await addSprites()
+      // The sprite of values is decoded after the viewer is created
+      const img = document.createElement('img')
+      img.id = 'values'
+      img.className = 'hidden'
+      document.body.appendChild(img)
+      const values = { sprite: 'values', offset: -2, scale: 0.01 }
+      const brain = brainsprite(viewerParams({
+        overlay: { sprite: 'overlay', nbSlice: Object.assign({}, nbSlice), opacity: 1, values }
+      }))
+      const before = Number.isNaN(brain.voxelValue) && !brain.nanValue
+      await loadImage(img, pngUrl(nbCol * nbSlice.Y, nbRow * nbSlice.Z, valuePixels()))
+      return {
+        before,
+        nanValue: Boolean(brain.nanValue),
+        value: brain.voxelValue,
+        expected: values.offset + quantized(2, 2, 1) * values.scale
+      }
+    })
+    expect(result.before).toBe(true)
+    expect(result.nanValue).toBe(false)
+    expect(result.value).toBe(result.expected)
+  })
+
+  it('decodes the quantized values of each voxel', async () => {
+    const result = await page.evaluate(async () => {
+      await addSprites()
+      await addImage('values', nbCol * nbSlice.Y, nbRow * nbSlice.Z, valuePixels())
+      const values = { sprite: 'values', offset: -2, scale: 0.01 }
+      const brain = brainsprite(viewerParams({
+        overlay: { sprite: 'overlay', nbSlice: Object.assign({}, nbSlice), opacity: 1, values }
+      }))
+      const found = []
+      const expected = []
+      for (let x = 0; x < nbSlice.X; x++) {
+        for (let y = 0; y < nbSlice.Y; y++) {
+          for (let z = 0; z < nbSlice.Z; z++) {
+            // Composing the viewer looks up the value at the current voxel
+            brain.numSlice = { X: x, Y: y, Z: z }
+            brain.release()
+            brain.compose()
+            // Transparent voxels have no value
+            found.push(Number.isNaN(brain.voxelValue) ? 'NaN' : brain.voxelValue)
+            expected.push((x + y + z) % 4 === 0
+              ? 'NaN'
+              : values.offset + quantized(x, y, z) * values.scale)
+          }
+        }
+      }
+      return { found, expected }
+    })
+    expect(result.found).toEqual(result.expected)
+  })
+
+  it('redraws the dirty planes once per frame', async () => {
+    const result = await page.evaluate(async () => {
+      await addSprites()
+      const brain = brainsprite(viewerParams())
+      const frames = []
+      window.requestAnimationFrame = function (callback) {
+        frames.push(callback)
+        return frames.length
+      }
+      const drawn = []
+      const draw = brain.draw
+      brain.draw = function (slice, type) {
+        drawn.push(type)
+        draw(slice, type)
+      }
+
+      // Requests are coalesced until the next frame
+      brain.requestDraw(['Y'])
+      brain.requestDraw(['Z', 'Y'])
+      const requested = { frames: frames.length, dirty: Object.assign({}, brain.dirty) }
+      frames[0]()
+      return {
+        requested,
+        drawn,
+        dirty: brain.dirty,
+        count: brain.frameTime.count,
+        frames: frames.length
+      }
+    })
+    expect(result.requested).toEqual({ frames: 1, dirty: { X: false, Y: true, Z: true } })
+    expect(result.drawn).toEqual(['Y', 'Z'])
+    expect(result.dirty).toEqual({ X: false, Y: false, Z: false })
+    expect(result.count).toBe(1)
+    expect(result.frames).toBe(1)
+  })
+
+  it('only redraws the planes changed by a click', async () => {
+    const result = await page.evaluate(async () => {
+      await addSprites()
+      const dirty = []
+      for (const crosshair of [false, true]) {
+        const brain = brainsprite(viewerParams({ crosshair, numSlice: { X: 3, Y: 2, Z: 2 } }))
+        window.requestAnimationFrame = function () {}
+        // Click on the coronal slice, which moves the X and Z cuts
+        const rect = brain.canvas.getBoundingClientRect()
+        brain.clickBrain({
+          clientX: rect.left + brain.widthCanvas.X + brain.widthCanvas.Y / 4,
+          clientY: rect.top + brain.heightCanvas.max / 2
+        })
+        dirty.push({ numSlice: brain.numSlice, dirty: brain.dirty })
+      }
+      return dirty
+    })
+    expect(result[0].numSlice).toEqual({ X: 1, Y: 2, Z: 1 })
+    expect(result[0].dirty).toEqual({ X: true, Y: false, Z: true })
+    // The crosshair of the coronal slice shows the X and Z cuts
+    expect(result[1].dirty).toEqual({ X: true, Y: true, Z: true })
+  })
+
+  it('draws the static annotations once per resize', async () => {
+    const result = await page.evaluate(async () => {
+      await addSprites()
+      const brain = brainsprite(viewerParams({ flagValue: true, flagCoordinates: true }))
+      let annotations = 0
+      const drawAnnotations = brain.drawAnnotations
+      brain.drawAnnotations = function () {
+        annotations++
+        drawAnnotations()
+      }
+      const texts = []
+      const fillText = brain.context.fillText
+      brain.context.fillText = function (text, x, y) {
+        texts.push(text.split(' ')[0])
+        fillText.call(brain.context, text, x, y)
+      }
+
+      // Redrawing the slices only draws the value and the coordinates
+      brain.drawAll()
+      const drawn = { annotations, texts }
+
+      // The colorbar of the layer shows on the coronal slice
+      const x = Math.round(brain.widthCanvas.X + brain.widthCanvas.Y / 2)
+      const y = Math.round(brain.heightCanvas.max * brain.heightColorBar)
+      const layer = Array.from(brain.contextAnnotations.getImageData(x, y, 1, 1).data)
+      const shown = Array.from(brain.context.getImageData(x, y, 1, 1).data)
+
+      document.getElementById('container').style.width = '400px'
+      const resized = brain.resize()
+      return { drawn, layer, shown, resized, annotations }
+    })
+    expect(result.drawn.annotations).toBe(0)
+    expect(result.drawn.texts.length).toBe(4)
+    expect(result.drawn.texts.slice(1)).toEqual(['x', 'y', 'z'])
+    expect(result.layer[3]).toBe(255)
+    expect(result.shown).toEqual(result.layer)
+    expect(result.resized).toBe(true)
+    expect(result.annotations).toBe(1)
+  })
+
+  it('reads the pixels of the overlay on demand in lazy mode', async () => {
+    const result = await page.evaluate(async () => {
+      await addSprites()
+      const brain = brainsprite(viewerParams({ lazy: true }))
+      const created = brain.overlay.pixels === null
+      // The viewer is composed once it is visible
+      for (let ii = 0; ii < 50 && !brain.planes.composed; ii++) {
+        await new Promise(function (resolve) { setTimeout(resolve, 20) })
+      }
+      const composed = brain.overlay.pixels !== null
+      brain.release()
+      return { created, composed, released: brain.overlay.pixels === null }
+    })
+    expect(result).toEqual({ created: true, composed: true, released: true })
+  })
+})
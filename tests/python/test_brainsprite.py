@@ -1,18 +1,29 @@
 """Test for brainsprite."""
 
 import os
+import subprocess
 import sys
 import warnings
+from ast import literal_eval
+from base64 import b64encode
+from io import BytesIO, StringIO
 from pathlib import Path
 
 import numpy as np
 import pytest
 import tempita
-from nibabel import Nifti1Image
+from matplotlib import colormaps
+from matplotlib.colors import Normalize
+from matplotlib.image import imsave
+from nibabel import Nifti1Image, load
+from nibabel.affines import apply_affine
 from nilearn import datasets, image
 from nilearn.image import get_data, new_img_like
+from PIL import Image
 
 from brainsprite import brainsprite as bp
+from brainsprite._cache import _DiskCache, _hash
+from brainsprite._cli import main
 
 
 def _simulate_img(affine=None):
@@ -63,6 +74,37 @@ def test_data_to_sprite():
     assert (sprite == gtruth).all(), "simulated sprite not as expected"
 
 
+def _data_to_sprite_loop(data, radiological=False):
+    """Tile a volume into a sprite one slice at a time, for reference."""
+    nx, ny, nz = data.shape
+    nrows = int(np.ceil(np.sqrt(nx)))
+    ncolumns = int(np.ceil(nx / float(nrows)))
+    sprite = np.zeros((nrows * nz, ncolumns * ny))
+    for xx in range(nx):
+        row, col = divmod(xx, ncolumns)
+        sl = data[nx - xx - 1] if radiological else data[xx]
+        sprite[row * nz : (row + 1) * nz, col * ny : (col + 1) * ny] = sl[:, ::-1].T
+    return sprite
+
+
+@pytest.mark.parametrize("radiological", [False, True])
+@pytest.mark.parametrize("shape", [(1, 3, 2), (5, 4, 3), (10, 7, 6), (17, 5, 9)])
+def test_data_to_sprite_matches_loop(shape, radiological):
+    rng = np.random.default_rng(0)
+    data = rng.standard_normal(shape).astype("float32")
+    sprite = bp._data_to_sprite(data, radiological=radiological)
+    assert sprite.dtype == data.dtype
+    np.testing.assert_array_equal(sprite, _data_to_sprite_loop(data, radiological))
+
+    # Check that a dirty preallocated buffer is fully overwritten
+    out = np.full(sprite.shape, np.nan)
+    assert bp._data_to_sprite(data, radiological=radiological, out=out) is out
+    np.testing.assert_array_equal(out, _data_to_sprite_loop(data, radiological))
+
+    with pytest.raises(ValueError):
+        bp._data_to_sprite(data, out=np.zeros((sprite.shape[0] + 1, sprite.shape[1])))
+
+
 def test_threshold_data():
     data = np.arange(-3, 4)
 
@@ -112,6 +154,127 @@ def test_save_sprite():
         assert sprite_base64.endswith("ABJRU5ErkJggg==")
 
 
+@pytest.mark.parametrize("radiological", [False, True])
+@pytest.mark.parametrize("suffix", [".nii", ".nii.gz"])
+def test_sprite_lut_indices(tmp_path, monkeypatch, radiological, suffix):
+    """Check that streaming the sprite by slabs matches the whole sprite."""
+    rng = np.random.default_rng(0)
+    data = rng.standard_normal((7, 5, 4)).astype("float32")
+    data[1, 2, 3] = np.nan
+    Nifti1Image(data, np.eye(4)).to_filename(tmp_path / f"img{suffix}")
+    img = load(tmp_path / f"img{suffix}")
+    mask = data < -1
+    mask_img = Nifti1Image(mask.astype("uint8"), np.eye(4))
+
+    # Count the reads of the file of the image
+    proxy = type(img.dataobj)
+    reads = []
+    getitem, array = proxy.__getitem__, proxy.__array__
+    monkeypatch.setattr(proxy, "__getitem__", lambda *args: reads.append("slab") or getitem(*args))
+    monkeypatch.setattr(proxy, "__array__", lambda *args: reads.append("all") or array(*args))
+
+    lut = bp._colormap_lut("cold_hot")
+    with pytest.warns(UserWarning, match="Non-finite"):
+        ind = bp._sprite_lut_indices(img, -2, 2, lut, mask=mask_img, radiological=radiological)
+    # Uncompressed files are read one row of tiles at a time, and compressed
+    # ones in a single pass
+    nrows, _ = bp._sprite_grid(data.shape[0])
+    assert reads == (["slab"] * nrows if suffix == ".nii" else ["all"])
+    expected, _ = bp._data_to_lut_indices(
+        bp._data_to_sprite(np.nan_to_num(data), radiological),
+        vmin=-2,
+        vmax=2,
+        cmap="cold_hot",
+        mask=bp._data_to_sprite(mask, radiological),
+    )
+    assert ind.dtype == expected.dtype
+    assert np.array_equal(ind, expected)
+
+
+@pytest.mark.parametrize("vmin, vmax", [(-2, 2), (None, None)])
+def test_save_sprite_float32(vmin, vmax):
+    """Check that float32 images get the pixels of a float64 sprite."""
+    # Values on the boundaries between colors, and their float32 neighbours
+    bounds = (-2 + np.arange(257) * 4 / 256).astype("float32")
+    data = np.stack([bounds, np.nextafter(bounds, -3), np.nextafter(bounds, 3)])
+    data = data.reshape(3, 1, 257)
+    mask = np.abs(data) < 0.1
+    img = Nifti1Image(data, np.eye(4))
+    mask_img = Nifti1Image(mask.astype("uint8"), np.eye(4))
+
+    output = BytesIO()
+    bp._save_sprite(img, vmax, vmin, output_sprite=output, mask=mask_img, cmap="cold_hot")
+
+    # Reference: a masked float64 sprite, colormapped by matplotlib
+    sprite = np.ma.array(bp._data_to_sprite(data.astype("float64")), mask=bp._data_to_sprite(mask))
+    expected = BytesIO()
+    imsave(expected, sprite, vmin=vmin, vmax=vmax, cmap="cold_hot", format="png")
+    output.seek(0)
+    expected.seek(0)
+    np.testing.assert_array_equal(np.asarray(Image.open(output)), np.asarray(Image.open(expected)))
+
+
+@pytest.mark.parametrize("dtype", ["float64", "float32", "int16"])
+@pytest.mark.parametrize("cmap", ["gray", "cold_hot"])
+@pytest.mark.parametrize("vmin, vmax", [(0, 1), (-2, 2), (0.5, 0.5), (None, None)])
+def test_data_to_rgba(dtype, cmap, vmin, vmax):
+    """Check that the lookup table matches matplotlib colormapping."""
+    rng = np.random.default_rng(0)
+    data = (10 * rng.standard_normal((13, 7))).astype(dtype)
+    data[0, :3] = [0, 1, -2]
+    mask = rng.random(data.shape) > 0.7
+
+    rgba = bp._data_to_rgba(data, vmin=vmin, vmax=vmax, cmap=cmap, mask=mask)
+
+    # Sprites were tiled in float64, and normalized in float64 by matplotlib
+    norm = Normalize(vmin=vmin, vmax=vmax)
+    expected = colormaps[cmap](norm(np.ma.array(data.astype("float64"), mask=mask)), bytes=True)
+    assert rgba.dtype == np.uint8
+    np.testing.assert_array_equal(rgba, expected)
+    assert (rgba[mask, 3] == 0).all()
+
+
+@pytest.mark.parametrize("png_backend", ["matplotlib", "zlib", "pillow"])
+@pytest.mark.parametrize("compression_level", [None, 0, 9])
+@pytest.mark.parametrize(
+    "cmap, masked, mode",
+    [("gray", False, "L"), ("cold_hot", True, "P"), ("viridis", False, "P")],
+)
+def test_save_png(png_backend, compression_level, cmap, masked, mode):
+    rng = np.random.default_rng(0)
+    data = rng.standard_normal((21, 34))
+    mask = rng.random(data.shape) > 0.5 if masked else None
+    ind, lut = bp._data_to_lut_indices(data, vmin=-1, vmax=1, cmap=cmap, mask=mask)
+
+    handle = BytesIO()
+    bp._save_png(handle, ind, lut, png_backend=png_backend, compression_level=compression_level)
+
+    # Check the image decodes to the expected colors
+    handle.seek(0)
+    png = Image.open(handle)
+    assert png.mode == ("RGBA" if png_backend == "matplotlib" else mode)
+    np.testing.assert_array_equal(
+        np.asarray(png.convert("RGBA")),
+        bp._data_to_rgba(data, vmin=-1, vmax=1, cmap=cmap, mask=mask),
+    )
+
+
+def test_save_png_rgba():
+    """Check images with more colors than a png palette can hold."""
+    lut = np.zeros((300, 4), dtype=np.uint8)
+    lut[:, 0] = np.arange(300) % 256
+    lut[:, 3] = 255 - np.arange(300) // 256
+    ind = np.arange(300, dtype=np.uint16).reshape(10, 30)
+
+    handle = BytesIO()
+    bp._save_png(handle, ind, lut, png_backend="zlib")
+    handle.seek(0)
+    np.testing.assert_array_equal(np.asarray(Image.open(handle)), lut.take(ind, axis=0))
+
+    with pytest.raises(ValueError):
+        bp._save_png(handle, ind, lut, png_backend="foo")
+
+
 def test_save_cmap():
     """This test covers _save_cmap."""
     # Save the cmap
@@ -135,6 +298,27 @@ def test_mask_stat_map():
     assert np.min((data == 0) == get_data(mask_img))
 
 
+@pytest.mark.parametrize(
+    "dtype, expected",
+    [
+        ("auto", ["float32", "int32"]),
+        ("float32", ["float32", "float32"]),
+        ("preserve", ["float64", "int16"]),
+    ],
+)
+def test_mask_stat_map_dtype(dtype, expected):
+    img, data = _simulate_img()
+    for img_dtype, expected_dtype in zip(["float64", "int16"], expected, strict=True):
+        img = Nifti1Image(data.astype(img_dtype), np.eye(4))
+        mask_img, img, data_t, _ = bp._mask_stat_map(img, threshold=0.5, dtype=dtype)
+        assert get_data(img).dtype == expected_dtype
+        assert data_t.dtype == expected_dtype
+        assert get_data(mask_img).dtype == np.uint8
+
+    with pytest.raises(ValueError, match="dtype"):
+        bp._mask_stat_map(img, dtype="float16")
+
+
 def test_load_bg_img():
     # Generate simple simulated data with non-diagonal affine
     affine = np.eye(4)
@@ -186,6 +370,129 @@ def test_resample_stat_map():
     ), "mask_img was not resampled at the resolution of background"
 
 
+@pytest.mark.parametrize("interpolation", ["continuous", "linear", "nearest"])
+@pytest.mark.parametrize("rotation, translation", [(0, None), (0.2, None), (0.3, [-60, -70, -50])])
+def test_resample_stat_map_matches_nilearn(interpolation, rotation, translation):
+    # The fused resampling gives exactly the output of two calls to
+    # nilearn.image.resample_to_img, for the stat map and the mask,
+    # with diagonal, rotated, and rotated and translated affines. The
+    # latter have voxels of the background on the edges of the stat map.
+    mni = datasets.load_mni152_template(resolution=2)
+    affine = 3 * np.eye(4 if translation else 3)
+    affine[:2, :2] = 3 * np.array(
+        [[np.cos(rotation), -np.sin(rotation)], [np.sin(rotation), np.cos(rotation)]]
+    )
+    shape = None
+    if translation:
+        affine[:, 3] = [*translation, 1]
+        shape = (40, 45, 38)
+    img = image.resample_img(
+        mni, target_affine=affine, target_shape=shape, copy_header=True, force_resample=True
+    )
+    img = new_img_like(img, get_data(img) - 0.5, img.affine)
+    mask_img, img, _, threshold = bp._mask_stat_map(img, threshold=0.2)
+    bg_img, _, _, _ = bp._load_bg_img(img, bg_img=mni)
+
+    stat_map_img, resampled_mask_img = bp._resample_stat_map(
+        img, bg_img, mask_img, resampling_interpolation=interpolation
+    )
+    expected = image.resample_to_img(
+        img, bg_img, interpolation=interpolation, force_resample=True, copy_header=True
+    )
+    expected_mask = image.resample_to_img(
+        mask_img,
+        bg_img,
+        fill_value=1,
+        interpolation="nearest",
+        force_resample=True,
+        copy_header=True,
+    )
+    assert np.array_equal(stat_map_img.affine, expected.affine)
+    assert get_data(stat_map_img).dtype == get_data(expected).dtype
+    assert np.array_equal(get_data(stat_map_img), get_data(expected))
+    assert np.array_equal(get_data(resampled_mask_img), get_data(expected_mask))
+
+    # Re-thresholding the resampled map masks voxels outside of the stat map,
+    # and the interpolated values below the threshold
+    stat_map_img, resampled_mask_img = bp._resample_stat_map(
+        img, bg_img, mask_img, interpolation, threshold, mask_resampling="threshold"
+    )
+    data = get_data(stat_map_img)
+    assert np.array_equal(data, get_data(expected))
+    assert np.array_equal(get_data(resampled_mask_img), np.abs(data) <= threshold)
+
+
+@pytest.mark.parametrize("interpolation", ["continuous", "nearest"])
+def test_resample_stat_map_float32(interpolation):
+    bg_img, _ = _simulate_img()
+    rng = np.random.default_rng(0)
+    affine = np.diag([1.5, 1.5, 1.5, 1])
+    img = Nifti1Image(rng.standard_normal((6, 6, 6)), affine)
+    mask_img = new_img_like(img, np.zeros((6, 6, 6), dtype=np.uint8), affine)
+
+    resampled = {}
+    for dtype in ["preserve", "float32"]:
+        stat_map_img, mask_img_r = bp._resample_stat_map(
+            img, bg_img, mask_img, interpolation, dtype=dtype
+        )
+        resampled[dtype] = get_data(stat_map_img)
+        assert get_data(mask_img_r).dtype == np.uint8
+    assert resampled["preserve"].dtype == np.float64
+    assert resampled["float32"].dtype == np.float32
+    assert np.allclose(resampled["float32"], resampled["preserve"], atol=1e-5)
+
+
+def test_resample_stat_map_same_grid():
+    # Stat maps on the grid of the background are not resampled, but still
+    # converted to float32
+    bg_img, data = _simulate_img()
+    img = new_img_like(bg_img, (10 * data).astype(np.int16), bg_img.affine)
+    mask_img = new_img_like(img, data > 0, img.affine)
+    for dtype, expected in [("auto", np.int16), ("float32", np.float32)]:
+        stat_map_img, mask_img_r = bp._resample_stat_map(img, bg_img, mask_img, dtype=dtype)
+        assert get_data(stat_map_img).dtype == expected
+        assert np.array_equal(get_data(stat_map_img), get_data(img))
+        assert np.array_equal(get_data(mask_img_r), data > 0)
+
+    # Affines are compared exactly, as in nilearn.image.resample_to_img
+    affine = bg_img.affine.copy()
+    affine[0, 3] += 1e-9
+    img = new_img_like(img, get_data(img), affine)
+    stat_map_img, _ = bp._resample_stat_map(img, bg_img, mask_img)
+    assert get_data(stat_map_img).dtype == np.float32
+
+
+def test_resample_stat_map_errors():
+    img, data = _simulate_img()
+    mask_img = new_img_like(img, data > 0, img.affine)
+    with pytest.raises(ValueError, match="resampling_interpolation"):
+        bp._resample_stat_map(img, img, mask_img, resampling_interpolation="cubic")
+    with pytest.raises(ValueError, match="mask_resampling"):
+        bp._resample_stat_map(img, img, mask_img, mask_resampling="linear")
+
+
+def test_crop_img():
+    img, data = _simulate_img()
+    bg_data = np.zeros([8, 8, 8])
+    bg_data[2:5, 3:6, 1:4] = 1
+    bg_img = new_img_like(img, bg_data, img.affine)
+
+    # The stat map is only counted outside of the mask
+    mask_img = new_img_like(img, np.zeros(img.shape), img.affine)
+    box = bp._bounding_box(bg_img, img, mask_img)
+    assert box == (slice(2, 5), slice(3, 6), slice(1, 5))
+    assert bp._bounding_box(mask_img, mask_img, mask_img) is None
+    mask_img = new_img_like(img, data != 0, img.affine)
+    assert bp._bounding_box(bg_img, img, mask_img) == (slice(2, 5), slice(3, 6), slice(1, 4))
+
+    # Cropping preserves world coordinates
+    bg_img = new_img_like(bg_img, bg_data, np.diag([2, 2, 2, 1]))
+    cropped = bp._crop_img(bg_img, box)
+    assert cropped.shape == (3, 3, 4)
+    assert np.array_equal(cropped.affine[:3, 3], [4, 6, 2])
+    assert np.array_equal(get_data(cropped), bg_data[box])
+
+
 def test_get_cut_slices():
     # Generate simple simulated data with one "spot"
     img, data = _simulate_img()
@@ -279,6 +586,465 @@ def test_viewer_substitute_radiological():
     _check_html(viewer)
 
 
+@pytest.mark.parametrize("png_backend", ["zlib", "pillow"])
+def test_viewer_substitute_png_backend(png_backend):
+    mni = datasets.load_mni152_template()
+    img = image.resample_img(
+        mni, target_affine=3 * np.eye(3), copy_header=True, force_resample=True
+    )
+    file_template = Path(__file__).resolve().parent / "data" / "html" / "viewer_template.html"
+    template = tempita.Template.from_filename(file_template, encoding="utf-8")
+
+    bsprite = bp.viewer_substitute(threshold=3, png_backend=png_backend, compression_level=1)
+    bsprite.fit(img)
+    viewer = bsprite.transform(template, javascript="js", html="html", library="bsprite")
+    _check_html(viewer)
+
+    # Check the grayscale background is smaller than with matplotlib
+    reference = bp.viewer_substitute(threshold=3, compression_level=1)
+    reference.fit(img)
+    assert len(bsprite.html_) < len(reference.html_)
+
+
+def test_viewer_substitute_dtype():
+    rng = np.random.default_rng(0)
+    img = Nifti1Image(rng.standard_normal((8, 8, 8)), np.diag([1.5, 1.5, 1.5, 1]))
+    bg_img, _ = _simulate_img()
+    viewers = {}
+    for dtype in ["preserve", "float32"]:
+        viewers[dtype] = bp.viewer_substitute(threshold=1, dtype=dtype)
+        viewers[dtype].fit(img, bg_img=bg_img)
+        assert "overlayImg" in viewers[dtype].html_
+
+    # The float64 stat map and background are handled in float32
+    for stage in ["mask", "load_background", "resampled"]:
+        sizes = {dtype: viewer.profile_[stage]["array_bytes"] for dtype, viewer in viewers.items()}
+        assert sizes["float32"] < sizes["preserve"]
+
+
+@pytest.mark.parametrize("bg_img, n_jobs", [("MNI152", 1), (None, 1), ("MNI152", 2)])
+def test_viewer_substitute_fit_many(bg_img, n_jobs):
+    mni = datasets.load_mni152_template()
+    img = image.resample_img(
+        mni, target_affine=3 * np.eye(3), copy_header=True, force_resample=True
+    )
+    imgs = [img, image.math_img("img - 100", img=img)]
+
+    bsprite = bp.viewer_substitute(threshold="auto", title="Slice viewer", n_jobs=n_jobs)
+    viewers = bsprite.fit_many(imgs, bg_img=bg_img)
+    assert len(viewers) == len(imgs)
+
+    # Check each viewer matches a separate fit, and leaves the original untouched
+    assert bsprite.threshold == "auto"
+    for viewer, img_ in zip(viewers, imgs, strict=True):
+        reference = bp.viewer_substitute(threshold="auto", title="Slice viewer")
+        reference.fit(img_, bg_img=bg_img)
+        assert viewer.html_ == reference.html_
+        assert viewer.javascript_ == reference.javascript_
+        assert viewer.threshold == reference.threshold
+
+
+def test_viewer_substitute_crop():
+    img, _ = _simulate_img(np.diag([2, 2, 2, 1]))
+    bg_data = np.zeros([16, 16, 16])
+    bg_data[4:12, 2:14, 6:10] = 1
+    bg_img = Nifti1Image(bg_data, np.eye(4))
+
+    viewers = [
+        bp.viewer_substitute(threshold=0.5, resampling_interpolation="nearest", crop=crop)
+        for crop in [None, "auto"]
+    ]
+    for viewer in viewers:
+        viewer.fit(img, bg_img=bg_img)
+    full, cropped = viewers
+    assert "X: 16,\n    Y: 16,\n    Z: 16" in full.javascript_
+    assert "X: 8,\n    Y: 12,\n    Z: 4" in cropped.javascript_
+    assert len(cropped.html_) < len(full.html_)
+
+    # The cuts are at the same world coordinates
+    def _cut_coords(viewer):
+        affine = viewer.javascript_.split("affine: ")[1].split(",\n")[0]
+        return apply_affine(np.array(literal_eval(affine)), viewer.cut_slices_)
+
+    assert np.allclose(_cut_coords(full), _cut_coords(cropped))
+
+    with pytest.raises(ValueError, match="crop"):
+        bp.viewer_substitute(crop="tight").fit(img, bg_img=bg_img)
+
+
+def test_quantize_values():
+    data = np.array([[-1.0, 0.0, 2.0, 5.0]])
+    mask = np.array([[False, True, False, False]])
+    for value_channel, levels in [("uint8", 255), ("uint16", 65535)]:
+        quantized, offset, scale = bp._quantize_values(data, mask, value_channel)
+        assert quantized[0, 1] == 0
+        assert quantized[0, 3] == levels
+        assert offset == -1.0
+        assert np.allclose(offset + quantized * scale, data * ~mask - mask, atol=scale / 2)
+
+    # Constant and empty data
+    _, offset, scale = bp._quantize_values(np.ones((2, 2)), np.zeros((2, 2), dtype=bool))
+    assert (offset, scale) == (1.0, 1.0)
+    _, offset, scale = bp._quantize_values(data, np.ones(data.shape, dtype=bool))
+    assert (offset, scale) == (0.0, 1.0)
+
+    with pytest.raises(ValueError, match="value_channel"):
+        bp._quantize_values(data, mask, "float32")
+
+
+@pytest.mark.parametrize("value_channel", ["uint8", "uint16"])
+def test_viewer_substitute_value_channel(value_channel):
+    img, data = _simulate_img()
+    data = data.copy()
+    data[2, 3, 4] = -0.3
+    img = Nifti1Image(data, np.eye(4))
+    bsprite = bp.viewer_substitute(
+        threshold=0.1, resampling_interpolation="nearest", value_channel=value_channel
+    )
+    bsprite.fit(img, bg_img=img)
+    assert len(bsprite.sprites_) == 4
+    assert 'id="overlayImgValues"' in bsprite.html_
+    assert 'sprite: "overlayImgValues"' in bsprite.javascript_
+
+    # Decode the values from the sprite, as brainsprite.js does
+    pixels = np.asarray(Image.open(BytesIO(bsprite.sprites_[3])))
+    quantization = bsprite.value_quantization_
+    values = quantization["offset"] + quantization["scale"] * (
+        pixels[..., 0].astype(int) * 256 + pixels[..., 1]
+    )
+    mask = pixels[..., 3] == 0
+    sprite = bp._data_to_sprite(data)
+    assert np.array_equal(mask, np.abs(sprite) < 0.1)
+    assert np.allclose(values[~mask], sprite[~mask])
+
+    # The values are also featured in pages
+    assert 'values: "overlayImgValues' in str(bp.make_page([bsprite]))
+
+    bsprite = bp.viewer_substitute(threshold=0.1)
+    bsprite.fit(img, bg_img=img)
+    assert len(bsprite.sprites_) == 3
+    assert bsprite.value_quantization_ is None
+    assert "Values" not in bsprite.html_ + bsprite.javascript_
+
+
+def test_write_html(tmp_path):
+    img, _ = _simulate_img()
+    file_template = Path(__file__).resolve().parent / "data" / "html" / "viewer_template.html"
+    template = tempita.Template.from_filename(file_template, encoding="utf-8")
+    bsprite = bp.viewer_substitute(threshold=0.5, title="Slice viewer")
+    bsprite.fit(img, bg_img=None)
+    viewer = bsprite.transform(template, javascript="js", html="html", library="bsprite")
+
+    # Writing to a file or a file object gives the output of transform
+    bsprite.write_html(
+        tmp_path / "viewer.html", template, javascript="js", html="html", library="bsprite"
+    )
+    assert (tmp_path / "viewer.html").read_text(encoding="utf-8") == str(viewer)
+    handle = StringIO()
+    bsprite.write_html(handle, template, javascript="js", html="html", library="bsprite")
+    assert handle.getvalue() == str(viewer)
+
+    # The sprites are encoded in base64 chunk by chunk
+    data = bsprite.sprites_[1]
+    for chunk_size in [3, 30, len(data)]:
+        handle = StringIO()
+        bp._write_base64(handle, data, chunk_size=chunk_size)
+        assert handle.getvalue() == b64encode(data).decode("utf-8")
+
+
+def test_viewer_substitute_files(tmp_path):
+    img, data = _simulate_img()
+    data = data.copy()
+    data[2, 2, 2] = -1
+    imgs = [img, new_img_like(img, data, img.affine)]
+    bg_img = new_img_like(img, np.ones(img.shape), img.affine)
+
+    bsprite = bp.viewer_substitute(threshold=0.5, base64=False, output_dir=tmp_path / "assets")
+    viewers = bsprite.fit_many(imgs, bg_img=bg_img)
+
+    # The background and colormap are shared, and the files are named after their content
+    assert viewers[0].assets_[0] == viewers[1].assets_[0]
+    assert viewers[0].assets_[1] != viewers[1].assets_[1]
+    assert len(list((tmp_path / "assets").iterdir())) == 4
+    for viewer in viewers:
+        assert "base64" not in viewer.html_
+        for path, data in zip(viewer.assets_, viewer.sprites_, strict=True):
+            assert path.read_bytes() == data
+            assert f'src="{path.as_posix()}"' in viewer.html_
+
+    # The files can be referred to with an url
+    bsprite = bp.viewer_substitute(
+        threshold=0.5, base64=False, output_dir=tmp_path / "assets", assets_url="https://cdn/"
+    )
+    bsprite.fit(img, bg_img=bg_img)
+    assert bsprite.assets_ == viewers[0].assets_
+    assert f'src="https://cdn/{bsprite.assets_[0].name}"' in bsprite.html_
+
+    # Sprites can be saved directly in a file
+    output = bp._save_sprite(img, vmax=1, vmin=0, output_sprite=tmp_path / "sprite.png")
+    assert Image.open(output).size == (24, 24)
+
+
+def test_viewer_substitute_library(tmp_path):
+    img, _ = _simulate_img()
+    viewers = [bp.viewer_substitute(threshold=0.5) for _ in range(2)]
+    for viewer in viewers:
+        viewer.fit(img, bg_img=None)
+
+    # The library is read once, and shared by all viewers
+    assert viewers[0].library_ is viewers[1].library_
+    assert viewers[0].library_ == bp._library()
+
+    # The library can be saved in a file shared by all viewers
+    for assets_url in [None, "https://cdn"]:
+        bsprite = bp.viewer_substitute(
+            threshold=0.5, library_mode="file", output_dir=tmp_path, assets_url=assets_url
+        )
+        bsprite.fit(img, bg_img=None)
+        assert bsprite.library_file_.read_text(encoding="utf-8") == bp._library()
+        assert bsprite.library_file_.parent == tmp_path
+        assert len(bsprite.library_) < len(bp._library())
+    assert f'var url = "https://cdn/{bsprite.library_file_.name}"' in bsprite.library_
+    assert len(list(tmp_path.iterdir())) == 1
+
+    with pytest.raises(ValueError, match="library_mode"):
+        bp.viewer_substitute(library_mode="cdn").fit(img, bg_img=None)
+
+
+def test_make_page(tmp_path):
+    img, data = _simulate_img()
+    data = data.copy()
+    data[2, 2, 2] = -1
+    imgs = [img, new_img_like(img, data, img.affine)]
+    bg_img = new_img_like(img, np.ones(img.shape), img.affine)
+    viewer = bp.viewer_substitute(threshold=0.5)
+    viewer.fit(img, bg_img=bg_img)
+
+    # Fitted viewers and stat maps can be mixed
+    page = bp.make_page([viewer, *imgs], bsprite=viewer, bg_img=bg_img, title="QC")
+    assert isinstance(page, bp.StatMapView)
+    html = str(page)
+    assert "<title>QC</title>" in html
+    assert html.count(bp._library()) == 1
+    for ii in range(3):
+        assert html.count(f'<canvas id="3Dviewer-{ii}">') == 1
+
+    # The background is shared, and the first two viewers are identical
+    assert html.count('<img id="spriteImg-') == 1
+    assert html.count('<img id="overlayImg-') == 2
+    assert "var lazy = true;" in html
+    assert "var lazy = false;" in str(bp.make_page([viewer], lazy=False))
+
+    # The page can be streamed to a file
+    path = tmp_path / "page.html"
+    bp.write_page(path, [viewer, *imgs], bsprite=viewer, bg_img=bg_img, title="QC")
+    assert path.read_text(encoding="utf-8") == html
+
+    # A page needs at least one viewer, and no file is written without
+    with pytest.raises(ValueError, match="viewers must not be empty"):
+        bp.make_page([])
+    with pytest.raises(ValueError, match="viewers must not be empty"):
+        bp.write_page(tmp_path / "empty.html", iter([]))
+    assert not (tmp_path / "empty.html").exists()
+
+
+def test_make_page_files(tmp_path):
+    img, _ = _simulate_img()
+    imgs = [img, new_img_like(img, -get_data(img), img.affine)]
+    bg_img = new_img_like(img, np.ones(img.shape), img.affine)
+
+    # Viewers can refer to files
+    bsprite = bp.viewer_substitute(
+        threshold=0.5, base64=False, library_mode="file", output_dir=tmp_path, assets_url="assets"
+    )
+    html = str(bp.make_page(imgs, bsprite=bsprite, bg_img=bg_img))
+    assert "base64" not in html
+    viewers = bsprite.fit_many(imgs, bg_img=bg_img)
+    assert f'data-src="assets/{viewers[0].assets_[0].name}"' in html
+    assert f'<script src="assets/{viewers[0].library_file_.name}"></script>' in html
+
+
+def test_viewer_substitute_n_jobs():
+    """Check that running the stages of fit in parallel gives the same viewer."""
+    img, _ = _simulate_img()
+    viewers = [bp.viewer_substitute(threshold=0.5, n_jobs=n_jobs) for n_jobs in [1, 2]]
+    for viewer in viewers:
+        viewer.fit(img, bg_img=None)
+    assert viewers[0].html_ == viewers[1].html_
+    assert viewers[0].javascript_ == viewers[1].javascript_
+
+
+def test_viewer_substitute_cache(tmp_path):
+    img, _ = _simulate_img()
+    viewers = [bp.viewer_substitute(threshold=0.5, cache_dir=tmp_path) for _ in range(2)]
+    for viewer in viewers:
+        viewer.fit(img, bg_img=None)
+
+    # The second fit should be entirely read from the cache
+    assert viewers[0].cache_info_ == {"hits": 0, "misses": 5}
+    assert viewers[1].cache_info_ == {"hits": 5, "misses": 0}
+    assert viewers[0].html_ == viewers[1].html_
+    assert (viewers[0].cut_slices_ == viewers[1].cut_slices_).all()
+
+    # Changing a parameter invalidates the sprites which depend on it
+    viewer = bp.viewer_substitute(threshold=0.5, cache_dir=tmp_path, radiological=True)
+    viewer.fit(img, bg_img=None)
+    assert viewer.cache_info_ == {"hits": 3, "misses": 2}
+
+    # The sprite of the MNI152 background is looked up in the same cache
+    for _ in range(2):
+        bp.clear_cache()
+        viewer = bp.viewer_substitute(threshold=0.5, cache_dir=tmp_path / "mni")
+        viewer.fit(img)
+    assert viewer.cache_info_ == {"hits": 5, "misses": 0}
+    assert viewer.profile_["load_background"]["cached"]
+
+
+def test_viewer_substitute_profile(tmp_path):
+    img, _ = _simulate_img()
+    records = []
+    viewers = [
+        bp.viewer_substitute(
+            threshold=0.5,
+            cache_dir=tmp_path,
+            profile_hook=lambda stage, record: records.append((stage, record)),
+        )
+        for _ in range(2)
+    ]
+    viewers[0].fit(img, bg_img=None)
+    stages = ["mask", "colorscale", "load_background", "resampled", "colormap"]
+    stages += ["background", "overlay", "cuts", "javascript"]
+    assert list(viewers[0].profile_) == stages
+    assert [stage for stage, _ in records] == stages
+    assert viewers[0].timings_ == {stage: record["time"] for stage, record in records}
+    profile = viewers[0].profile_
+    assert all(record["time"] > 0 and not record["cached"] for record in profile.values())
+    assert profile["overlay"]["output_bytes"] == len(viewers[0].sprites_[1])
+    assert profile["resampled"]["array_bytes"] > 0
+    assert profile["javascript"]["output_bytes"] == len(viewers[0].javascript_)
+
+    # The stages read from the cache take no time
+    viewers[1].fit(img, bg_img=None)
+    assert viewers[1].profile_["overlay"] == {**profile["overlay"], "time": 0.0, "cached": True}
+    assert not viewers[1].profile_["mask"]["cached"]
+
+
+def test_fit_many_profile_hook():
+    # The hook is called in the calling process, not in the workers
+    img, _ = _simulate_img()
+    records = []
+    bsprite = bp.viewer_substitute(
+        threshold=0.5, n_jobs=2, profile_hook=lambda stage, record: records.append((stage, record))
+    )
+    viewers = bsprite.fit_many([img, img], bg_img=None)
+    expected = [item for viewer in viewers for item in viewer.profile_.items()]
+    assert len(expected) == 2 * len(viewers[0].profile_)
+    assert records == expected
+    assert all(viewer.profile_hook is bsprite.profile_hook for viewer in viewers)
+
+
+def test_disk_cache(tmp_path):
+    cache = _DiskCache(tmp_path, max_bytes=2500)
+    key = _hash("a", np.arange(3), 1.5)
+    assert key == _hash("a", np.arange(3), 1.5)
+    assert key != _hash("a", np.arange(3, dtype="int8"), 1.5)
+    assert cache.get(key) is None
+    cache.put(key, "value")
+    assert cache.get(key) == "value"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Check that the least recently used entries are evicted
+    for ii in range(3):
+        cache.put(str(ii), np.zeros(100))
+        os.utime(tmp_path / f"{ii}.pkl", (ii + 1, ii + 1))
+    cache.put("3", np.zeros(100))
+    assert cache.get("0") is None
+    assert cache.get("1") is None
+    for key_ in [key, "2", "3"]:
+        assert cache.get(key_) is not None
+
+
+def test_clear_cache():
+    img, _ = _simulate_img()
+    bp.clear_cache()
+    viewers = [bp.viewer_substitute(threshold=0.5) for _ in range(2)]
+    for viewer in viewers:
+        viewer.fit(img)
+    assert len(bp._BACKGROUND_MEMO) == 1
+    assert viewers[0].html_ == viewers[1].html_
+
+    # The memo is keyed on the parameters of the background
+    for radiological in [True, False]:
+        bp.viewer_substitute(threshold=0.5, radiological=radiological).fit(img)
+    assert len(bp._BACKGROUND_MEMO) == 2
+
+    bp.clear_cache()
+    assert len(bp._BACKGROUND_MEMO) == 0
+
+
+def test_import_is_lazy():
+    # Heavy dependencies are only imported by the stages which need them
+    code = (
+        "import sys, brainsprite; "
+        "print([name for name in ('matplotlib', 'nilearn.plotting', 'scipy', 'tempita') "
+        "if name in sys.modules])"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    assert literal_eval(output) == []
+
+
+def test_cli(tmp_path, capsys):
+    img, _ = _simulate_img()
+    for name in ["a.nii.gz", "b.nii"]:
+        img.to_filename(tmp_path / name)
+    args = [str(tmp_path / "*.nii*"), "-o", str(tmp_path / "out"), "--bg-img", "none"]
+    main([*args, "--threshold", "0.5"])
+    pages = sorted((tmp_path / "out").glob("*.html"))
+    assert [page.name for page in pages] == ["a.html", "b.html"]
+    assert "var viewers" in pages[0].read_text()
+    assert "Rendered 2 viewers" in capsys.readouterr().out
+
+    # Pages newer than their stat map, with the same options, are skipped
+    mtimes = [page.stat().st_mtime_ns for page in pages]
+    main([*args, "--threshold", "0.5"])
+    assert "Rendered 0 viewers" in capsys.readouterr().out
+    assert [page.stat().st_mtime_ns for page in pages] == mtimes
+
+    # Stat maps listed in a manifest
+    (tmp_path / "manifest.txt").write_text("# QC\na.nii.gz\n\n")
+    main(["-m", str(tmp_path / "manifest.txt"), "-o", str(tmp_path / "m"), "--bg-img", "none"])
+    assert [page.name for page in (tmp_path / "m").glob("*.html")] == ["a.html"]
+
+    # Stat maps with the same name would overwrite each other's page
+    (tmp_path / "sub").mkdir()
+    img.to_filename(tmp_path / "sub" / "a.nii.gz")
+    with pytest.raises(SystemExit):
+        main([str(tmp_path / "**" / "a.nii.gz"), "-o", str(tmp_path / "out")])
+    with pytest.raises(SystemExit):
+        main([str(tmp_path / "*.mgz"), "-o", str(tmp_path / "out")])
+
+
+def test_cli_options(tmp_path, capsys):
+    img, _ = _simulate_img()
+    for name in ["a.nii.gz", "b.nii"]:
+        img.to_filename(tmp_path / name)
+    args = [str(tmp_path / "*.nii*"), "-o", str(tmp_path / "out"), "--bg-img", "none"]
+    main([*args, "--threshold", "0.5"])
+    assert "Rendered 2 viewers" in capsys.readouterr().out
+
+    # Pages rendered with other options are rendered again, as are forced pages
+    main(args)
+    assert "Rendered 2 viewers" in capsys.readouterr().out
+    main([*args, "--radiological"])
+    assert "Rendered 2 viewers" in capsys.readouterr().out
+    main([*args, "--radiological"])
+    assert "Rendered 0 viewers" in capsys.readouterr().out
+    main([*args, "--force", "--n-jobs", "2", "--dtype", "float32"])
+    assert "Rendered 2 viewers" in capsys.readouterr().out
+
+
 def _check_html(html_view):
     """Check the presence of some expected code in the html viewer."""
     assert isinstance(html_view, bp.StatMapView)